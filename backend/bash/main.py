@@ -1,35 +1,296 @@
-import subprocess
 import os
+import signal
 import asyncio
-from typing import Dict, Any, Optional, AsyncGenerator
+import codecs
+import re
+import secrets
+import shlex
+import shutil
+import time
+import types
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, AsyncGenerator, Tuple
 from datetime import datetime, timezone
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import logging
-import json
+import orjson
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-
 # Environment variables
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:8080").split(",")
+BASH_POOL_SIZE = int(os.getenv("BASH_POOL_SIZE", "4"))
+BASH_WORKER_MAX_EXECUTIONS = int(os.getenv("BASH_WORKER_MAX_EXECUTIONS", "100"))
+EXECUTION_TIMEOUT = 30  # seconds
+SESSIONS_ROOT = "/tmp/bash_sessions"
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_SWEEP_INTERVAL = 60  # seconds
+PIPE_READ_SIZE = 65536
+SSE_COALESCE_BYTES = 16384
+SSE_COALESCE_DELAY = 0.005  # seconds
+
+# Baseline environment shared by every session; sessions only store overrides
+_BASE_ENV = types.MappingProxyType(dict(os.environ))
+# Environment for streamed commands without overrides, built once
+_STREAM_ENV = {**_BASE_ENV, "PYTHONUNBUFFERED": "1", "TERM": "dumb"}
+
+# Dispatcher run by each pooled bash process. It reads NUL-terminated
+# (working directory, command) pairs from stdin, runs the command in a
+# subshell so state can't leak between requests, and marks the end of each
+# command on stdout and stderr with a sentinel carrying the exit code. The
+# sentinel arrives as $1 so workers can inherit the server's environment.
+# Job control (set -m) puts each command in its own process group, which is
+# killed once the command returns so background jobs it started can't write
+# into the shared pipes during a later request.
+_DISPATCHER = r"""
+__sentinel="$1"
+set --
+set -m
+# Commands get the real stderr as fd 3; the dispatcher's own stderr, where job
+# control reports job status, is discarded
+exec 3>&2 2>/dev/null
+while IFS= read -r -d '' __dir && IFS= read -r -d '' __code; do
+    ( cd "$__dir" && eval "$__code" ) </dev/null 2>&3 3>&- &
+    __pid=$!
+    wait "$__pid"
+    __rc=$?
+    kill -KILL -- "-$__pid"
+    printf '%s%d\n' "$__sentinel" "$__rc"
+    printf '%s%d\n' "$__sentinel" "$__rc" >&3
+done
+"""
+
+
+class BashWorker:
+    """A long-lived bash process that executes commands sent over its stdin"""
+
+    def __init__(self, process: asyncio.subprocess.Process, sentinel: str):
+        self.process = process
+        self.sentinel = sentinel.encode()
+        self.pattern = re.compile(re.escape(self.sentinel) + rb"(\d+)\n$")
+        self.execution_count = 0
+
+    @classmethod
+    async def spawn(cls) -> "BashWorker":
+        sentinel = f"__WEBREPL_END_{secrets.token_hex(8)}__"
+        process = await asyncio.create_subprocess_exec(
+            "/bin/bash", "--noprofile", "--norc", "-c", _DISPATCHER, "bash", sentinel,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        return cls(process, sentinel)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def _read_until_sentinel(self, stream: asyncio.StreamReader) -> Tuple[bytes, int]:
+        buffer = bytearray()
+        # The sentinel always ends the output, so only the tail that could
+        # hold it (plus an exit code of up to three digits and the newline)
+        # is searched rather than the whole buffer on every chunk
+        tail = len(self.sentinel) + 4
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                raise RuntimeError("Bash worker exited unexpectedly")
+            buffer += chunk
+            match = self.pattern.search(buffer, max(len(buffer) - tail, 0))
+            if match:
+                return bytes(buffer[:match.start()]), int(match.group(1))
+
+    async def run(self, code: str, cwd: str, env_overrides: Optional[Dict[str, str]] = None) -> Tuple[str, str, int]:
+        """Run code in cwd and return (stdout, stderr, return code)"""
+        if env_overrides:
+            exports = "".join(f"export {k}={shlex.quote(v)}\n" for k, v in env_overrides.items())
+            code = exports + code
+        # NUL terminates each field of the dispatcher protocol, so one inside
+        # the code would shift every later (directory, command) pair
+        if "\0" in code or "\0" in cwd:
+            raise ValueError("embedded null byte")
+        self.execution_count += 1
+        self.process.stdin.write(cwd.encode() + b"\0" + code.encode() + b"\0")
+        await self.process.stdin.drain()
+        (stdout, return_code), (stderr, _) = await asyncio.gather(
+            self._read_until_sentinel(self.process.stdout),
+            self._read_until_sentinel(self.process.stderr)
+        )
+        return (
+            stdout.decode("utf-8", errors="replace"),
+            stderr.decode("utf-8", errors="replace"),
+            return_code
+        )
+
+    async def kill(self):
+        # Commands run in their own process groups, so kill everything in the
+        # worker's session rather than just its process group
+        for pid in _session_pids(self.process.pid):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        await self.process.wait()
+
+
+def _session_pids(sid: int) -> List[int]:
+    """List the processes belonging to session sid"""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            if os.getsid(int(entry)) == sid:
+                pids.append(int(entry))
+        except (ProcessLookupError, PermissionError):
+            pass
+    return pids
+
+
+class BashWorkerPool:
+    """Fixed-size pool of pre-started bash workers"""
+
+    def __init__(self, size: int, max_executions: int):
+        self.size = size
+        self.max_executions = max_executions
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._workers: set = set()
+
+    async def start(self):
+        for _ in range(self.size):
+            await self._add_worker()
+
+    async def _add_worker(self):
+        worker = await BashWorker.spawn()
+        self._workers.add(worker)
+        self._idle.put_nowait(worker)
+
+    async def acquire(self) -> BashWorker:
+        return await self._idle.get()
+
+    async def release(self, worker: BashWorker, healthy: bool = True):
+        """Return a worker to the pool, replacing it if it is spent or broken"""
+        if healthy and worker.alive and worker.execution_count < self.max_executions:
+            self._idle.put_nowait(worker)
+            return
+        self._workers.discard(worker)
+        await worker.kill()
+        await self._add_worker()
+
+    async def close(self):
+        for worker in list(self._workers):
+            await worker.kill()
+        self._workers.clear()
+
+
+pool: Optional[BashWorkerPool] = None
+
+# Pre-encoded SSE framing; only the event payload is serialized per event
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_PREFIXES = {
+    "output": b'data: {"type":"output","content":',
+    "error": b'data: {"type":"error","content":',
+}
+_EVENT_SUFFIX = b"}\n\n"
+
+def _sse_event(payload: Dict[str, Any]) -> bytes:
+    return _SSE_PREFIX + orjson.dumps(payload) + _SSE_SUFFIX
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: create the sessions root and pre-warm the bash worker pool
+    global pool
+    os.makedirs(SESSIONS_ROOT, exist_ok=True)
+    pool = BashWorkerPool(BASH_POOL_SIZE, BASH_WORKER_MAX_EXECUTIONS)
+    await pool.start()
+    logger.info(f"Started bash worker pool with {BASH_POOL_SIZE} workers")
+    sweeper = asyncio.create_task(_sweep_expired_sessions())
+    yield
+    # Shutdown: stop the session sweeper and all workers
+    sweeper.cancel()
+    await pool.close()
+    _fs_executor.shutdown(wait=True)
+
+class FastCORS:
+    """Allow-all CORS middleware with precomputed headers for development.
+
+    Avoids CORSMiddleware's per-request origin matching and header
+    negotiation when every origin is allowed anyway. Credentials are allowed,
+    and browsers reject a wildcard origin on credentialed requests, so the
+    request's Origin is echoed back with Vary: Origin like CORSMiddleware does.
+    """
+
+    _CORS_HEADERS = [
+        (b"access-control-allow-credentials", b"true"),
+    ]
+    _PREFLIGHT_HEADERS = _CORS_HEADERS + [
+        (b"access-control-allow-methods", b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"),
+        (b"access-control-max-age", b"600"),
+        (b"content-length", b"2"),
+        (b"content-type", b"text/plain; charset=utf-8"),
+        (b"vary", b"Origin"),
+    ]
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        origin = request_headers.get(b"origin")
+        if origin is None:
+            # Not a cross-origin request, so no CORS headers are needed
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS" and b"access-control-request-method" in request_headers:
+            headers = [(b"access-control-allow-origin", origin)] + self._PREFLIGHT_HEADERS
+            requested = request_headers.get(b"access-control-request-headers")
+            if requested:
+                headers.append((b"access-control-allow-headers", requested))
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": b"OK"})
+            return
+
+        cors_headers = [(b"access-control-allow-origin", origin)] + self._CORS_HEADERS
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                # Merge Origin into any Vary header the response already has
+                headers = []
+                vary = []
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"vary":
+                        vary.append(value)
+                    else:
+                        headers.append((name, value))
+                vary.append(b"Origin")
+                message["headers"] = headers + cors_headers + [(b"vary", b", ".join(vary))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Configure CORS
 if ENVIRONMENT == "development":
-    # Development: Allow all origins
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
-    )
+    # Development: Allow all origins with static headers
+    app.add_middleware(FastCORS)
 else:
     # Production: Restrict to specified origins
     app.add_middleware(
@@ -40,8 +301,9 @@ else:
         allow_headers=["*"],
     )
 
-# Session storage: Each session has its own execution environment
-sessions: Dict[str, Dict[str, Any]] = {}
+# Session storage: Each session has its own execution environment.
+# Kept in least-recently-used order so eviction pops from the front.
+sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
 
 class CodeRequest(BaseModel):
     code: str
@@ -50,63 +312,136 @@ class ExecuteResponse(BaseModel):
     output: str
     error: Optional[str] = None
 
-def get_or_create_session(session_id: str) -> Dict[str, Any]:
+def validate_session_id(session_id: str):
+    """Reject session IDs that could escape the sessions directory"""
+    if "/" in session_id or session_id in (".", "..") or "\0" in session_id:
+        raise HTTPException(status_code=400, detail="Invalid session ID")
+
+# Blocking filesystem cleanup runs here so it never stalls the event loop
+_fs_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bash-fs")
+
+# Session directories known to exist, so repeat creations skip the syscall
+_ensured_dirs: set = set()
+
+def _ensure_directory(path: str):
+    """Create a session directory directly under SESSIONS_ROOT"""
+    if path not in _ensured_dirs:
+        try:
+            os.mkdir(path)
+        except FileExistsError:
+            pass
+        _ensured_dirs.add(path)
+
+def _discard_directory(path: str) -> Future:
+    """Remove a session directory in the background.
+
+    The directory is first renamed out of the way so a session recreated
+    with the same ID gets a fresh directory that the cleanup can't touch.
+    """
+    _ensured_dirs.discard(path)
+    trash = f"{path}.deleted-{secrets.token_hex(4)}"
+    try:
+        os.rename(path, trash)
+    except OSError:
+        trash = path
+    return _fs_executor.submit(shutil.rmtree, trash, True)
+
+def _evict_session(session_id: str):
+    """Drop a session from memory and remove its working directory"""
+    session = sessions.pop(session_id)
+    _discard_directory(session["working_directory"])
+    logger.info(f"Evicted Bash session: {session_id}")
+
+# Per-session locks serializing first-time creation of a session
+_creating_locks: Dict[str, asyncio.Lock] = {}
+
+async def get_or_create_session(session_id: str) -> Dict[str, Any]:
     """Get existing session or create new one"""
     if session_id not in sessions:
-        sessions[session_id] = {
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "last_accessed": datetime.now(timezone.utc).isoformat(),
-            "execution_count": 0,
-            "working_directory": f"/tmp/bash_sessions/{session_id}",
-            "environment": os.environ.copy()
-        }
-        # Create session-specific working directory
-        os.makedirs(sessions[session_id]["working_directory"], exist_ok=True)
-        logger.info(f"Created new Bash session: {session_id}")
+        lock = _creating_locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            if session_id not in sessions:
+                working_directory = f"{SESSIONS_ROOT}/{session_id}"
+                # Create session-specific working directory off the event loop
+                await asyncio.get_running_loop().run_in_executor(
+                    _fs_executor, _ensure_directory, working_directory
+                )
+                sessions[session_id] = {
+                    "created_at_ns": time.time_ns(),
+                    "last_accessed_ns": time.time_ns(),
+                    "execution_count": 0,
+                    "working_directory": working_directory,
+                    "env_overrides": {}
+                }
+                logger.info(f"Created new Bash session: {session_id}")
+                # Bound memory and disk use by evicting the least recently used sessions
+                while len(sessions) > MAX_SESSIONS:
+                    _evict_session(next(iter(sessions)))
+        _creating_locks.pop(session_id, None)
     
-    sessions[session_id]["last_accessed"] = datetime.now(timezone.utc).isoformat()
+    sessions[session_id]["last_accessed_ns"] = time.time_ns()
+    sessions.move_to_end(session_id)
     return sessions[session_id]
 
+async def _sweep_expired_sessions():
+    """Periodically evict sessions idle for longer than SESSION_TTL_SECONDS"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        cutoff = time.time_ns() - SESSION_TTL_SECONDS * 1_000_000_000
+        while sessions and next(iter(sessions.values()))["last_accessed_ns"] < cutoff:
+            _evict_session(next(iter(sessions)))
+
+# Health payload is constant, so it is serialized once at import
+_HEALTH_BODY = orjson.dumps({"status": "healthy", "service": "bash-backend"})
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "bash-backend"}
+    # A fresh Response per call: middleware may append headers to the
+    # response's header list, so a shared instance would accumulate them
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 @app.post("/execute/{session_id}", response_model=ExecuteResponse)
 async def execute_code(session_id: str, request: CodeRequest):
     """Execute Bash code in a session-specific environment"""
     
-    if not request.code or request.code.strip() == "":
+    if not request.code or request.code.isspace():
         raise HTTPException(status_code=400, detail="Code cannot be empty")
+    if "\0" in request.code:
+        raise HTTPException(status_code=400, detail="Code cannot contain NUL characters")
+    
+    validate_session_id(session_id)
     
-    session = get_or_create_session(session_id)
+    session = await get_or_create_session(session_id)
     session["execution_count"] += 1
     
     try:
-        # Execute the bash command in the session's working directory
-        result = subprocess.run(
-            request.code,
-            shell=True,
-            capture_output=True,
-            text=True,
-            cwd=session["working_directory"],
-            env=session["environment"],
-            timeout=30  # 30 second timeout
-        )
+        # Hand the command to a pre-warmed bash worker instead of paying
+        # fork/exec and interpreter startup on every request
+        worker = await pool.acquire()
+        healthy = False
+        try:
+            stdout, stderr, return_code = await asyncio.wait_for(
+                worker.run(request.code, session["working_directory"], session["env_overrides"]),
+                timeout=EXECUTION_TIMEOUT
+            )
+            healthy = True
+        finally:
+            await pool.release(worker, healthy)
         
         # Combine stdout and stderr for output
-        output = result.stdout
-        error = result.stderr if result.stderr else None
+        output = stdout
+        error = stderr if stderr else None
         
         # If command failed with non-zero exit code, include that in error
-        if result.returncode != 0 and not error:
-            error = f"Command exited with code {result.returncode}"
+        if return_code != 0 and not error:
+            error = f"Command exited with code {return_code}"
         
         logger.info(f"Session {session_id}: Executed command (count: {session['execution_count']})")
         
         return ExecuteResponse(output=output, error=error)
         
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         logger.warning(f"Session {session_id}: Command timed out")
         return ExecuteResponse(
             output="",
@@ -119,149 +454,165 @@ async def execute_code(session_id: str, request: CodeRequest):
             error=f"Error executing command: {str(e)}"
         )
 
-async def stream_command_output(session_id: str, code: str) -> AsyncGenerator[str, None]:
+async def _pump(stream: asyncio.StreamReader, kind: str, queue: asyncio.Queue):
+    """Forward output from a subprocess pipe into the shared output queue.
+
+    Reads whatever is available rather than splitting on newlines, so long
+    lines and carriage-return progress output are forwarded promptly. Chunks
+    arriving in quick succession are coalesced into a single chunk,
+    flushed once SSE_COALESCE_BYTES accumulate or SSE_COALESCE_DELAY passes.
+    """
+    loop = asyncio.get_running_loop()
+    # Incremental decoder carries multi-byte sequences split across reads
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = bytearray()
+    flush_at = 0.0
+
+    async def flush(final: bool = False):
+        text = decoder.decode(buffer, final)
+        buffer.clear()
+        if text:
+            await queue.put((kind, text))
+
+    read = asyncio.ensure_future(stream.read(PIPE_READ_SIZE))
+    try:
+        while True:
+            timeout = max(flush_at - loop.time(), 0) if buffer else None
+            done, _ = await asyncio.wait({read}, timeout=timeout)
+            if not done:
+                # Nothing more arrived within the coalescing window
+                await flush()
+                continue
+            chunk = read.result()
+            if not chunk:
+                break
+            if not buffer:
+                flush_at = loop.time() + SSE_COALESCE_DELAY
+            buffer += chunk
+            if len(buffer) >= SSE_COALESCE_BYTES:
+                await flush()
+            read = asyncio.ensure_future(stream.read(PIPE_READ_SIZE))
+    finally:
+        read.cancel()
+    await flush(final=True)
+    await queue.put(None)
+
+async def stream_command_output(session_id: str, code: str) -> AsyncGenerator[bytes, None]:
     """Stream command output using Server-Sent Events"""
-    session = get_or_create_session(session_id)
+    session = await get_or_create_session(session_id)
     session["execution_count"] += 1
     
     process = None
+    pumps = []
     try:
         # Set environment to reduce buffering
-        env = session["environment"].copy()
-        env["PYTHONUNBUFFERED"] = "1"
-        env["TERM"] = "dumb"
-        
-        # Write the command to a temporary script file to ensure proper execution
-        import tempfile
-        import os
-        
-        # Create temporary script file for proper bash execution
-        script_fd, script_path = tempfile.mkstemp(suffix='.sh', dir=session["working_directory"])
-        try:
-            script_content = f"#!/bin/bash\nset -e\n{code}\n"
-            with os.fdopen(script_fd, 'w') as script_file:
-                script_file.write(script_content)
-            
-            # Make the script executable
-            os.chmod(script_path, 0o755)
-            
-            process = await asyncio.create_subprocess_exec(
-                '/bin/bash', script_path,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=session["working_directory"],
-                env=env
-            )
-        except Exception as e:
-            # Cleanup script file on error
-            try:
-                os.unlink(script_path)
-            except:
-                pass
-            raise e
+        env = _STREAM_ENV
+        if session["env_overrides"]:
+            env = {**_STREAM_ENV, **session["env_overrides"]}
         
-        # Stream output line by line from both stdout and stderr
-        async def stream_output():
-            """Stream lines from stdout and stderr as they become available"""
-            
-            # Read output line by line as it becomes available
-            while True:
-                # Check if process is still running
-                if process.returncode is not None:
-                    break
-                
-                # Try to read a line from stdout
-                try:
-                    line = await asyncio.wait_for(process.stdout.readline(), timeout=0.1)
-                    if line:
-                        decoded_line = line.decode('utf-8', errors='replace')
-                        yield f"data: {json.dumps({'type': 'output', 'content': decoded_line})}\n\n"
-                    else:
-                        # Empty line means EOF - check stderr too
-                        try:
-                            stderr_line = await asyncio.wait_for(process.stderr.readline(), timeout=0.01)
-                            if stderr_line:
-                                decoded_line = stderr_line.decode('utf-8', errors='replace')
-                                yield f"data: {json.dumps({'type': 'error', 'content': decoded_line})}\n\n"
-                        except asyncio.TimeoutError:
-                            pass
-                        # If no stdout and process might be done, break
-                        break
-                except asyncio.TimeoutError:
-                    # No output available yet, but process might still be running
-                    # Check stderr too
-                    try:
-                        stderr_line = await asyncio.wait_for(process.stderr.readline(), timeout=0.01)
-                        if stderr_line:
-                            decoded_line = stderr_line.decode('utf-8', errors='replace')
-                            yield f"data: {json.dumps({'type': 'error', 'content': decoded_line})}\n\n"
-                    except asyncio.TimeoutError:
-                        pass
-                    # Continue waiting for more output
-                    continue
-        
-        # Stream output and wait for process completion concurrently
-        output_done = False
+        # Pass the code straight to bash as argv instead of via a script file
+        process = await asyncio.create_subprocess_exec(
+            '/bin/bash', '--noprofile', '--norc', '-c', f"set -e\n{code}",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=session["working_directory"],
+            env=env
+        )
         
-        async def stream_and_check():
-            nonlocal output_done
-            async for line in stream_output():
-                yield line
-            output_done = True
+        # One reader task per pipe fans output into a single queue, so each
+        # chunk is forwarded as soon as it is available on either stream
+        queue: asyncio.Queue = asyncio.Queue()
+        pumps = [
+            asyncio.create_task(_pump(process.stdout, 'output', queue)),
+            asyncio.create_task(_pump(process.stderr, 'error', queue)),
+        ]
         
-        # Create tasks for streaming and process completion
-        stream_task = stream_and_check()
+        deadline = asyncio.get_running_loop().time() + EXECUTION_TIMEOUT
+        sentinels_remaining = len(pumps)
+        while sentinels_remaining:
+            remaining = deadline - asyncio.get_running_loop().time()
+            item = await asyncio.wait_for(queue.get(), timeout=max(remaining, 0))
+            if item is None:
+                sentinels_remaining -= 1
+                continue
+            kind, text = item
+            yield _PREFIXES[kind] + orjson.dumps(text) + _EVENT_SUFFIX
         
-        # Continue streaming until both output is done AND process completes
-        async for line in stream_task:
-            yield line
-            
         # Wait for process to complete
         return_code = await process.wait()
         
-        # Cleanup the temporary script file
-        try:
-            os.unlink(script_path)
-        except:
-            pass
-        
         # Send completion event
-        yield f"data: {json.dumps({'type': 'complete', 'returnCode': return_code})}\n\n"
+        yield _sse_event({'type': 'complete', 'returnCode': return_code})
         
         logger.info(f"Session {session_id}: Streamed command execution completed")
         
     except asyncio.TimeoutError:
         logger.warning(f"Session {session_id}: Command timed out")
-        yield f"data: {json.dumps({'type': 'error', 'content': 'Command execution timed out after 30 seconds'})}\n\n"
-        if process:
-            process.kill()
-            await process.wait()
-        # Cleanup script file
-        try:
-            os.unlink(script_path)
-        except:
-            pass
+        yield _sse_event({'type': 'error', 'content': 'Command execution timed out after 30 seconds'})
     except Exception as e:
         logger.error(f"Session {session_id}: Streaming execution error: {str(e)}")
-        yield f"data: {json.dumps({'type': 'error', 'content': f'Error executing command: {str(e)}'})}\n\n"
-        if process:
+        yield _sse_event({'type': 'error', 'content': f'Error executing command: {str(e)}'})
+    finally:
+        for task in pumps:
+            task.cancel()
+        if process and process.returncode is None:
             try:
                 process.kill()
                 await process.wait()
-            except:
+            except ProcessLookupError:
+                pass
+
+async def stream_raw_output(session_id: str, code: str) -> AsyncGenerator[bytes, None]:
+    """Stream combined stdout/stderr bytes exactly as the command produces them"""
+    session = await get_or_create_session(session_id)
+    session["execution_count"] += 1
+    
+    env = _STREAM_ENV
+    if session["env_overrides"]:
+        env = {**_STREAM_ENV, **session["env_overrides"]}
+    
+    # stderr shares the stdout pipe so both arrive interleaved in one stream
+    process = await asyncio.create_subprocess_exec(
+        '/bin/bash', '--noprofile', '--norc', '-c', f"set -e\n{code}",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        cwd=session["working_directory"],
+        env=env
+    )
+    try:
+        deadline = asyncio.get_running_loop().time() + EXECUTION_TIMEOUT
+        while True:
+            remaining = deadline - asyncio.get_running_loop().time()
+            chunk = await asyncio.wait_for(process.stdout.read(PIPE_READ_SIZE), timeout=max(remaining, 0))
+            if not chunk:
+                break
+            yield chunk
+        await process.wait()
+        logger.info(f"Session {session_id}: Raw command execution completed")
+    except asyncio.TimeoutError:
+        logger.warning(f"Session {session_id}: Raw command timed out")
+        # The raw stream has no framing to carry an error, so abort the
+        # response instead of ending it; the client then sees an incomplete
+        # body rather than output that looks like a finished run
+        raise
+    finally:
+        if process.returncode is None:
+            try:
+                process.kill()
+                await process.wait()
+            except ProcessLookupError:
                 pass
-        # Cleanup script file
-        try:
-            os.unlink(script_path)
-        except:
-            pass
 
 @app.post("/execute-stream/{session_id}")
 async def execute_code_stream(session_id: str, request: CodeRequest):
     """Execute Bash code with streaming output using Server-Sent Events"""
     
-    if not request.code or request.code.strip() == "":
+    if not request.code or request.code.isspace():
         raise HTTPException(status_code=400, detail="Code cannot be empty")
+    if "\0" in request.code:
+        raise HTTPException(status_code=400, detail="Code cannot contain NUL characters")
+    
+    validate_session_id(session_id)
     
     return StreamingResponse(
         stream_command_output(session_id, request.code),
@@ -273,25 +624,42 @@ async def execute_code_stream(session_id: str, request: CodeRequest):
         }
     )
 
+@app.post("/execute-raw/{session_id}")
+async def execute_code_raw(session_id: str, request: CodeRequest):
+    """Execute Bash code and stream its raw output bytes without SSE framing"""
+    
+    if not request.code or request.code.isspace():
+        raise HTTPException(status_code=400, detail="Code cannot be empty")
+    if "\0" in request.code:
+        raise HTTPException(status_code=400, detail="Code cannot contain NUL characters")
+    
+    validate_session_id(session_id)
+    
+    return StreamingResponse(
+        stream_raw_output(session_id, request.code),
+        media_type="application/octet-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Disable nginx buffering
+        }
+    )
+
 @app.post("/reset/{session_id}")
 async def reset_session(session_id: str):
     """Reset a specific session"""
+    validate_session_id(session_id)
     if session_id in sessions:
-        # Clean up working directory
-        working_dir = sessions[session_id]["working_directory"]
-        if os.path.exists(working_dir):
-            try:
-                # Remove all files in the working directory
-                subprocess.run(f"rm -rf {working_dir}/*", shell=True, check=False)
-            except:
-                pass
-        
-        # Remove session from memory
-        del sessions[session_id]
+        # Clean up working directory and remove session from memory
+        working_dir = sessions.pop(session_id)["working_directory"]
+        await asyncio.wrap_future(_discard_directory(working_dir))
         logger.info(f"Reset session: {session_id}")
         
     return {"message": "Session reset successfully"}
 
+def _format_timestamp(ns: int) -> str:
+    """Format a time.time_ns() timestamp as an ISO 8601 UTC string"""
+    return datetime.fromtimestamp(ns / 1e9, tz=timezone.utc).isoformat()
+
 @app.get("/sessions")
 async def list_sessions():
     """List all active sessions with metadata"""
@@ -299,8 +667,8 @@ async def list_sessions():
     for session_id, session_data in sessions.items():
         session_list.append({
             "id": session_id,
-            "created_at": session_data["created_at"],
-            "last_accessed": session_data["last_accessed"],
+            "created_at": _format_timestamp(session_data["created_at_ns"]),
+            "last_accessed": _format_timestamp(session_data["last_accessed_ns"]),
             "execution_count": session_data["execution_count"],
             "working_directory": session_data["working_directory"]
         })
@@ -308,4 +676,4 @@ async def list_sessions():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
\ No newline at end of file
@@ -2,12 +2,26 @@ import pytest
 import requests
 import json
 import os
+import time
 
 # Test configuration
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
 TEST_SESSION_ID = "test-session-123"
 REQUEST_TIMEOUT = 10  # seconds
 
+# Shared HTTP session so connections are kept alive across tests. Created by
+# the fixture below and closed when the test run ends.
+SESSION = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def http_session():
+    """Create the shared HTTP session and close it at the end"""
+    global SESSION
+    SESSION = requests.Session()
+    yield SESSION
+    SESSION.close()
+
 
 class TestBashBackend:
     """Test suite for Bash backend webserver"""
@@ -16,13 +30,13 @@ class TestBashBackend:
         """Helper method to make requests with consistent timeout"""
         url = f"{BASE_URL}{endpoint}"
         kwargs.setdefault('timeout', REQUEST_TIMEOUT)
-        return getattr(requests, method)(url, **kwargs)
+        return getattr(SESSION, method)(url, **kwargs)
 
     def setup_method(self):
         """Setup before each test"""
         # Clean up any existing test session
         try:
-            requests.post(f"{BASE_URL}/reset/{TEST_SESSION_ID}", timeout=5)
+            SESSION.post(f"{BASE_URL}/reset/{TEST_SESSION_ID}", timeout=5)
         except requests.exceptions.RequestException:
             pass
 
@@ -30,13 +44,13 @@ class TestBashBackend:
         """Cleanup after each test"""
         # Reset test session
         try:
-            requests.post(f"{BASE_URL}/reset/{TEST_SESSION_ID}", timeout=5)
+            SESSION.post(f"{BASE_URL}/reset/{TEST_SESSION_ID}", timeout=5)
         except requests.exceptions.RequestException:
             pass
 
     def test_health_endpoint(self):
         """Test health check endpoint"""
-        response = requests.get(f"{BASE_URL}/health", timeout=REQUEST_TIMEOUT)
+        response = SESSION.get(f"{BASE_URL}/health", timeout=REQUEST_TIMEOUT)
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "healthy"
@@ -45,7 +59,7 @@ class TestBashBackend:
     def test_simple_echo_command(self):
         """Test basic echo command execution"""
         code = "echo 'Hello World'"
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": code},
             timeout=REQUEST_TIMEOUT
@@ -57,7 +71,7 @@ class TestBashBackend:
 
     def test_pwd_command(self):
         """Test pwd command returns session working directory"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "pwd"},
             timeout=REQUEST_TIMEOUT
@@ -69,7 +83,7 @@ class TestBashBackend:
     def test_file_operations(self):
         """Test file creation and reading"""
         # Create a file
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "echo 'test content' > testfile.txt"},
             timeout=REQUEST_TIMEOUT
@@ -77,7 +91,7 @@ class TestBashBackend:
         assert response.status_code == 200
         
         # Read the file
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "cat testfile.txt"}
         )
@@ -88,14 +102,14 @@ class TestBashBackend:
     def test_directory_operations(self):
         """Test directory creation and navigation"""
         # Create directory
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "mkdir testdir"}
         )
         assert response.status_code == 200
         
         # List directory
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "ls -la"}
         )
@@ -105,7 +119,7 @@ class TestBashBackend:
 
     def test_environment_variables(self):
         """Test environment variable access"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "echo $HOME"}
         )
@@ -115,7 +129,7 @@ class TestBashBackend:
 
     def test_error_handling(self):
         """Test command that produces error"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "ls /nonexistent"}
         )
@@ -125,7 +139,7 @@ class TestBashBackend:
 
     def test_empty_code_validation(self):
         """Test validation of empty code"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": ""}
         )
@@ -134,14 +148,14 @@ class TestBashBackend:
     def test_session_persistence(self):
         """Test that files persist between commands in same session"""
         # Create file in first command
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "echo 'persistent data' > persistent.txt"}
         )
         assert response.status_code == 200
         
         # Read file in second command
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "cat persistent.txt"}
         )
@@ -155,14 +169,14 @@ class TestBashBackend:
         
         try:
             # Create file in first session
-            response = requests.post(
+            response = SESSION.post(
                 f"{BASE_URL}/execute/{TEST_SESSION_ID}",
                 json={"code": "echo 'session1 data' > isolation_test.txt"}
             )
             assert response.status_code == 200
             
             # Try to read file from second session (should fail)
-            response = requests.post(
+            response = SESSION.post(
                 f"{BASE_URL}/execute/{session2}",
                 json={"code": "cat isolation_test.txt"}
             )
@@ -173,13 +187,58 @@ class TestBashBackend:
         finally:
             # Cleanup second session
             try:
-                requests.post(f"{BASE_URL}/reset/{session2}", timeout=5)
+                SESSION.post(f"{BASE_URL}/reset/{session2}", timeout=5)
             except requests.exceptions.RequestException:
                 pass
 
+    def test_background_job_output_does_not_leak(self):
+        """Test that a background job's late output never reaches another session"""
+        session2 = "test-session-789"
+        
+        try:
+            response = SESSION.post(
+                f"{BASE_URL}/execute/{TEST_SESSION_ID}",
+                json={"code": "(sleep 0.5; echo LATE-FROM-A; echo LATE-ERR >&2) &"}
+            )
+            assert response.status_code == 200
+            time.sleep(1)
+            
+            # Cycle through every pooled worker so one is the worker A used
+            for _ in range(8):
+                response = SESSION.post(
+                    f"{BASE_URL}/execute/{session2}",
+                    json={"code": "echo hi-from-B"}
+                )
+                assert response.status_code == 200
+                data = response.json()
+                assert data["output"] == "hi-from-B\n"
+                assert data["error"] is None
+        finally:
+            try:
+                SESSION.post(f"{BASE_URL}/reset/{session2}", timeout=5)
+            except requests.exceptions.RequestException:
+                pass
+
+    def test_nul_in_code_is_rejected(self):
+        """Test that code containing NUL is rejected and workers stay usable"""
+        for endpoint in ("execute", "execute-stream", "execute-raw"):
+            response = SESSION.post(
+                f"{BASE_URL}/{endpoint}/{TEST_SESSION_ID}",
+                json={"code": "echo a\u0000echo SECRET-A"}
+            )
+            assert response.status_code == 400
+        
+        for _ in range(8):
+            response = SESSION.post(
+                f"{BASE_URL}/execute/{TEST_SESSION_ID}",
+                json={"code": "echo still-ok"}
+            )
+            assert response.status_code == 200
+            assert response.json()["output"] == "still-ok\n"
+
     def test_pipe_operations(self):
         """Test bash pipe operations"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "echo 'hello world' | wc -w"}
         )
@@ -190,18 +249,18 @@ class TestBashBackend:
     def test_session_reset(self):
         """Test session reset functionality"""
         # Create a file
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "echo 'will be deleted' > temp.txt"}
         )
         assert response.status_code == 200
         
         # Reset session
-        response = requests.post(f"{BASE_URL}/reset/{TEST_SESSION_ID}")
+        response = SESSION.post(f"{BASE_URL}/reset/{TEST_SESSION_ID}")
         assert response.status_code == 200
         
         # Try to read file (should fail after reset)
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "cat temp.txt"}
         )
@@ -212,13 +271,13 @@ class TestBashBackend:
     def test_list_sessions(self):
         """Test listing active sessions"""
         # Execute a command to create session
-        requests.post(
+        SESSION.post(
             f"{BASE_URL}/execute/{TEST_SESSION_ID}",
             json={"code": "echo 'create session'"}
         )
         
         # List sessions
-        response = requests.get(f"{BASE_URL}/sessions")
+        response = SESSION.get(f"{BASE_URL}/sessions")
         assert response.status_code == 200
         data = response.json()
         
@@ -229,7 +288,7 @@ class TestBashBackend:
     def test_streaming_endpoint_basic(self):
         """Test streaming endpoint basic functionality"""
         # Test with simple command
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute-stream/{TEST_SESSION_ID}",
             json={"code": "echo 'streaming test'"},
             headers={"Accept": "text/event-stream"},
@@ -257,7 +316,7 @@ class TestBashBackend:
     def test_streaming_with_loop(self):
         """Test streaming endpoint with time-based loop"""
         # Test with command that produces output over time
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute-stream/{TEST_SESSION_ID}",
             json={"code": "for i in {1..3}; do echo 'Line $i'; sleep 0.1; done"},
             headers={"Accept": "text/event-stream"},
@@ -282,6 +341,34 @@ class TestBashBackend:
         assert len(complete_events) == 1
         assert complete_events[0]["returnCode"] == 0
 
+    def test_raw_endpoint_passes_bytes_through(self):
+        """Test raw endpoint returns unframed stdout and stderr bytes"""
+        response = SESSION.post(
+            f"{BASE_URL}/execute-raw/{TEST_SESSION_ID}",
+            json={"code": "printf 'abc\\x00\\xff'; echo 'oops' >&2"},
+            timeout=REQUEST_TIMEOUT
+        )
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/octet-stream"
+        assert b"abc\x00\xff" in response.content
+        assert b"oops\n" in response.content
+        assert b"data: " not in response.content
+
+    def test_raw_endpoint_aborts_on_timeout(self):
+        """Test raw endpoint aborts the response when the command times out"""
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            response = SESSION.post(
+                f"{BASE_URL}/execute-raw/{TEST_SESSION_ID}",
+                json={"code": "echo started; sleep 60"},
+                timeout=45
+            )
+            response.content
+        
+        # The service keeps answering after the aborted run
+        response = SESSION.get(f"{BASE_URL}/health", timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 200
+
 
 if __name__ == "__main__":
     # Run specific tests
@@ -1,5 +1,6 @@
 import pytest
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
 import uuid
@@ -8,62 +9,94 @@ import uuid
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
 SESSION_MANAGER_URL = os.getenv("SESSION_MANAGER_URL", "http://localhost:8000")
 REQUEST_TIMEOUT = 10  # seconds
+HEALTH_URL = f"{BASE_URL}/health"
+SESSIONS_URL = f"{SESSION_MANAGER_URL}/sessions"
+
+# Shared HTTP session so connections are kept alive across tests. Created
+# lazily by the fixture below so each pytest-xdist worker gets its own pool.
+SESSION = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def http_session():
+    """Create the shared HTTP session for this worker and close it at the end"""
+    global SESSION
+    SESSION = requests.Session()
+    # Tests within a worker run serially, so one connection per host (backend
+    # and session manager) is enough; block rather than open a second one
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=1, pool_block=True, max_retries=0)
+    SESSION.mount("http://", adapter)
+    SESSION.mount("https://", adapter)
+    # Open the backend connection up front so the first test doesn't pay for it
+    try:
+        SESSION.head(HEALTH_URL, timeout=REQUEST_TIMEOUT)
+    except requests.exceptions.RequestException:
+        pass
+    yield SESSION
+    SESSION.close()
 
 
 class TestJavaScriptBackend:
     """Test suite for JavaScript backend webserver"""
 
-    def setup_method(self):
-        """Setup before each test - create a test session"""
-        # Create a unique test session for each test
-        self.test_session_id = str(uuid.uuid4())
+    @pytest.fixture(scope="class", autouse=True)
+    def class_session(self, request):
+        """Create one JavaScript session shared by every test in the class"""
+        session_id = str(uuid.uuid4())
         
         # Create session via session manager
         try:
-            response = requests.post(
-                f"{SESSION_MANAGER_URL}/sessions",
+            response = SESSION.post(
+                SESSIONS_URL,
                 json={
-                    "name": f"Test Session {self.test_session_id[:8]}",
+                    "name": f"Test Session {session_id[:8]}",
                     "language": "javascript"
                 },
                 timeout=5
             )
             if response.status_code == 200:
-                session_data = response.json()
-                self.test_session_id = session_data["id"]
+                session_id = response.json()["id"]
         except requests.exceptions.RequestException:
             # If session creation fails, continue with generated UUID
             pass
-
-    def teardown_method(self):
-        """Cleanup after each test - delete the test session"""
+        
+        request.cls.test_session_id = session_id
+        # Build the per-session URLs once instead of formatting them in every test
+        request.cls.execute_url = f"{BASE_URL}/execute/{session_id}"
+        request.cls.reset_url = f"{BASE_URL}/reset/{session_id}"
+        request.cls.session_url = f"{SESSIONS_URL}/{session_id}"
+        yield session_id
+        
+        # Cleanup once all tests in the class have run
         try:
-            requests.delete(
-                f"{SESSION_MANAGER_URL}/sessions/{self.test_session_id}",
-                timeout=5
-            )
+            SESSION.delete(request.cls.session_url, timeout=5)
         except requests.exceptions.RequestException:
             pass
 
-    def _make_request(self, method, endpoint, **kwargs):
-        """Helper method to make requests with consistent timeout"""
-        url = f"{BASE_URL}{endpoint}"
-        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
-        return getattr(requests, method)(url, **kwargs)
+    @pytest.fixture(autouse=True)
+    def clean_context(self, request, class_session):
+        """Reset the shared session before tests that need a clean context"""
+        if request.node.get_closest_marker("dirty_ok") is None:
+            try:
+                SESSION.post(self.reset_url, timeout=5)
+            except requests.exceptions.RequestException:
+                pass
 
+    @pytest.mark.dirty_ok
     def test_health_endpoint(self):
         """Test health check endpoint"""
-        response = requests.get(f"{BASE_URL}/health", timeout=REQUEST_TIMEOUT)
+        response = SESSION.get(HEALTH_URL, timeout=REQUEST_TIMEOUT)
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "ok"
         assert data["language"] == "javascript"
 
+    @pytest.mark.dirty_ok
     def test_simple_console_log(self):
         """Test basic console.log execution"""
         code = "console.log('Hello World');"
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code},
             timeout=REQUEST_TIMEOUT
         )
@@ -75,8 +108,8 @@ class TestJavaScriptBackend:
     def test_variable_declaration(self):
         """Test variable declaration and output"""
         code = "const x = 42; console.log(x);"
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code},
             timeout=REQUEST_TIMEOUT
         )
@@ -88,8 +121,8 @@ class TestJavaScriptBackend:
     def test_arithmetic_operations(self):
         """Test basic arithmetic and math operations"""
         code = "const result = 10 + 5 * 2; console.log(result);"
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code},
             timeout=REQUEST_TIMEOUT
         )
@@ -105,8 +138,8 @@ class TestJavaScriptBackend:
         }
         console.log(greet('World'));
         """
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code},
             timeout=REQUEST_TIMEOUT
         )
@@ -121,8 +154,8 @@ class TestJavaScriptBackend:
         const doubled = arr.map(x => x * 2);
         console.log(doubled);
         """
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code},
             timeout=REQUEST_TIMEOUT
         )
@@ -136,8 +169,8 @@ class TestJavaScriptBackend:
         const obj = { name: 'Test', value: 123 };
         console.log(obj.name + ': ' + obj.value);
         """
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code},
             timeout=REQUEST_TIMEOUT
         )
@@ -145,10 +178,11 @@ class TestJavaScriptBackend:
         data = response.json()
         assert "Test: 123" in data["output"]
 
+    @pytest.mark.dirty_ok
     def test_error_handling(self):
         """Test JavaScript syntax/runtime error handling"""
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": "undefinedVariable.someMethod();"}
         )
         assert response.status_code == 200
@@ -157,54 +191,78 @@ class TestJavaScriptBackend:
         assert ("ReferenceError" in data["error"] or "TypeError" in data["error"] or 
                 "undefined" in data["error"])
 
+    @pytest.mark.dirty_ok
     def test_syntax_error_handling(self):
         """Test handling of syntax errors"""
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": "const x = ;"}  # Invalid syntax
         )
         assert response.status_code == 200
         data = response.json()
         assert data["error"] is not None
 
+    @pytest.mark.dirty_ok
     def test_empty_code_validation(self):
         """Test validation of empty code"""
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": ""}
         )
         assert response.status_code == 400
 
     def test_session_persistence(self):
+        """Test that a variable declared in an execution is readable in it"""
+        response = SESSION.post(
+            self.execute_url,
+            json={"code": "const persistentVar = 'I persist!'; console.log(persistentVar);"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert "I persist!" in data["output"]
+
+    def test_function_persistence(self):
+        """Test that a function defined in an execution is callable in it"""
+        response = SESSION.post(
+            self.execute_url,
+            json={"code": "function multiply(a, b) { return a * b; } console.log(multiply(6, 7));"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert "42" in data["output"]
+
+    @pytest.mark.slow
+    def test_session_persistence_across_requests(self):
         """Test that variables persist between executions in same session"""
         # Set variable in first request
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": "const persistentVar = 'I persist!';"}
         )
         assert response.status_code == 200
         
         # Use variable in second request
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": "console.log(persistentVar);"}
         )
         assert response.status_code == 200
         data = response.json()
         assert "I persist!" in data["output"]
 
-    def test_function_persistence(self):
+    @pytest.mark.slow
+    def test_function_persistence_across_requests(self):
         """Test that functions persist between executions in same session"""
         # Define function in first request
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": "function multiply(a, b) { return a * b; }"}
         )
         assert response.status_code == 200
         
         # Use function in second request
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": "console.log(multiply(6, 7));"}
         )
         assert response.status_code == 200
@@ -216,8 +274,8 @@ class TestJavaScriptBackend:
         # Create a second session
         session2_id = str(uuid.uuid4())
         try:
-            response = requests.post(
-                f"{SESSION_MANAGER_URL}/sessions",
+            response = SESSION.post(
+                SESSIONS_URL,
                 json={
                     "name": f"Test Session 2 {session2_id[:8]}",
                     "language": "javascript"
@@ -232,14 +290,14 @@ class TestJavaScriptBackend:
         
         try:
             # Set variable in first session
-            response = requests.post(
-                f"{BASE_URL}/execute/{self.test_session_id}",
+            response = SESSION.post(
+                self.execute_url,
                 json={"code": "const isolatedVar = 'session1';"}
             )
             assert response.status_code == 200
             
             # Try to access variable from second session (should fail)
-            response = requests.post(
+            response = SESSION.post(
                 f"{BASE_URL}/execute/{session2_id}",
                 json={"code": "console.log(isolatedVar);"}
             )
@@ -250,26 +308,26 @@ class TestJavaScriptBackend:
         finally:
             # Cleanup second session
             try:
-                requests.delete(f"{SESSION_MANAGER_URL}/sessions/{session2_id}", timeout=5)
+                SESSION.delete(f"{SESSIONS_URL}/{session2_id}", timeout=5)
             except requests.exceptions.RequestException:
                 pass
 
     def test_session_reset(self):
         """Test session reset functionality"""
         # Create a variable
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": "const resetTestVar = 'will be deleted';"}
         )
         assert response.status_code == 200
         
         # Reset session
-        response = requests.post(f"{BASE_URL}/reset/{self.test_session_id}")
+        response = SESSION.post(self.reset_url)
         assert response.status_code == 200
         
         # Try to access variable (should fail after reset)
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": "console.log(resetTestVar);"}
         )
         assert response.status_code == 200
@@ -284,8 +342,8 @@ class TestJavaScriptBackend:
         const squared = numbers.map(n => n * n);
         console.log(`First: ${first}, Second: ${second}, Squared: ${squared}`);
         """
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code}
         )
         assert response.status_code == 200
@@ -307,8 +365,8 @@ class TestJavaScriptBackend:
         const person = new Person('Alice');
         console.log(person.greet());
         """
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code}
         )
         assert response.status_code == 200
@@ -323,8 +381,8 @@ class TestJavaScriptBackend:
         });
         promise.then(result => console.log(result));
         """
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code}
         )
         assert response.status_code == 200
@@ -339,14 +397,15 @@ class TestJavaScriptBackend:
         const parsed = JSON.parse(jsonString);
         console.log(parsed.name + ': ' + parsed.value);
         """
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code}
         )
         assert response.status_code == 200
         data = response.json()
         assert "test: 42" in data["output"]
 
+    @pytest.mark.dirty_ok
     def test_multiple_console_outputs(self):
         """Test multiple console.log statements in single execution"""
         code = """
@@ -354,8 +413,8 @@ class TestJavaScriptBackend:
         console.log('Line 2');
         console.log('Line 3');
         """
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code}
         )
         assert response.status_code == 200
@@ -364,14 +423,15 @@ class TestJavaScriptBackend:
         assert "Line 2" in data["output"]
         assert "Line 3" in data["output"]
 
+    @pytest.mark.dirty_ok
     def test_console_error_output(self):
         """Test console.error output capture"""
         code = """
         console.log('Normal output');
         console.error('Error output');
         """
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code}
         )
         assert response.status_code == 200
@@ -379,21 +439,23 @@ class TestJavaScriptBackend:
         assert "Normal output" in data["output"]
         assert "Error output" in data["output"]
 
+    @pytest.mark.dirty_ok
     def test_expression_evaluation(self):
         """Test that expressions return values when no console output"""
         code = "5 + 3"
-        response = requests.post(
-            f"{BASE_URL}/execute/{self.test_session_id}",
+        response = SESSION.post(
+            self.execute_url,
             json={"code": code}
         )
         assert response.status_code == 200
         data = response.json()
         assert "8" in data["output"]
 
+    @pytest.mark.dirty_ok
     def test_invalid_session_handling(self):
         """Test handling of invalid session ID"""
         invalid_session = "invalid-session-id"
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{invalid_session}",
             json={"code": "console.log('test');"}
         )
@@ -25,6 +25,9 @@ import javax.script.SimpleBindings
 
 private val logger = LoggerFactory.getLogger("KotlinREPL")
 val SESSION_MANAGER_URL = System.getenv("SESSION_MANAGER_URL") ?: "http://session-manager:8000"
+// Placeholder environment recorded for sessions whose bindings live in memory;
+// the session manager requires serialized_data to be base64 encoded
+val MEMORY_STORED_MARKER: String = Base64.getEncoder().encodeToString("memory-stored".toByteArray())
 
 class KotlinREPLServer {
     private val httpClient = HttpClient(CIO)
@@ -46,7 +49,7 @@ class KotlinREPLServer {
             // Also notify the session manager that we had activity
             httpClient.put("$SESSION_MANAGER_URL/sessions/$sessionId/environment") {
                 contentType(ContentType.Application.Json)
-                setBody("""{"language": "kotlin", "serialized_data": "memory-stored"}""")
+                setBody("""{"language": "kotlin", "serialized_data": "$MEMORY_STORED_MARKER"}""")
             }
         } catch (e: Exception) {
             logger.warn("Failed to notify session manager: ${e.message}")
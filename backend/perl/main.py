@@ -4,14 +4,19 @@ Executes Perl code in isolated session environments
 """
 
 import os
+import asyncio
 import logging
-import subprocess
-import tempfile
+import secrets
+import signal
+import time
+import shutil
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
+import orjson
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 # Configure logging
@@ -21,7 +26,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Perl Backend")
+app = FastAPI(title="Perl Backend", default_response_class=ORJSONResponse)
 
 # Configure CORS
 environment = os.getenv("ENVIRONMENT", "development")
@@ -35,19 +40,172 @@ else:
 logger.info(f"Environment: {environment}")
 logger.info(f"CORS origins: {cors_origins}")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=cors_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+class StaticCORSMiddleware:
+    """Minimal ASGI CORS middleware with headers precomputed at startup.
+
+    Non-preflight requests only get header appends; preflights are answered
+    directly without reaching the app.
+    """
+
+    def __init__(self, app, allow_origins: List[str]):
+        self.app = app
+        self.allow_all = "*" in allow_origins
+        self.allow_origins = frozenset(origin.encode() for origin in allow_origins)
+        # Credentials are allowed, and browsers reject a wildcard origin on
+        # credentialed requests, so an allowed Origin is always echoed back
+        # (even when every origin is allowed), as CORSMiddleware does
+        self.common_headers = [
+            (b"access-control-allow-credentials", b"true"),
+            (b"vary", b"Origin"),
+        ]
+        self.preflight_headers = self.common_headers + [
+            (b"access-control-allow-methods", b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"),
+            (b"access-control-max-age", b"600"),
+            (b"content-length", b"0"),
+        ]
+
+    def _headers_for(self, base: List[Tuple[bytes, bytes]], origin: Optional[bytes]):
+        if origin is not None and (self.allow_all or origin in self.allow_origins):
+            return base + [(b"access-control-allow-origin", origin)]
+        return base
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        origin = request_headers.get(b"origin")
+
+        if scope["method"] == "OPTIONS" and b"access-control-request-method" in request_headers:
+            headers = self._headers_for(self.preflight_headers, origin)
+            requested = request_headers.get(b"access-control-request-headers")
+            if requested:
+                headers = headers + [(b"access-control-allow-headers", requested)]
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        cors_headers = self._headers_for(self.common_headers, origin)
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + cors_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+app.add_middleware(StaticCORSMiddleware, allow_origins=cors_origins)
 
-# Session storage: maps session_id to session data
-sessions: Dict[str, Dict] = {}
+# Session storage: maps session_id to session data, in least-recently-used
+# order so the oldest session is evicted first once MAX_SESSIONS is reached
+sessions: "OrderedDict[str, Dict]" = OrderedDict()
 
-class CodeRequest(BaseModel):
-    code: str
+EXECUTION_TIMEOUT = 30  # seconds
+# Header written at the top of every session's history file
+_PERL_HEADER = b"#!/usr/bin/perl\nuse strict;\nuse warnings;\n\n"
+# Marker preceding each execution in the history file
+_EXECUTION_MARKER = b"\n# Execution %d\n"
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "100"))
+# Root for session directories; point at a tmpfs such as /dev/shm to keep
+# history writes and interpreter file IO in memory
+SESSIONS_ROOT = os.getenv("PERL_SESSIONS_ROOT", "/tmp/perl_sessions")
+
+# Driver run by each session's persistent perl process. It reads
+# length-prefixed code blocks from stdin and evals them in package main, so
+# subroutines, packages and package variables persist between executions
+# (strict 'vars' is relaxed so undeclared variables are package globals). After
+# each block it writes the sentinel (passed as the first argument) followed by
+# a status flag to stdout, and the sentinel alone to stderr, each as a single
+# write so the marker never straddles reads.
+PERL_REPL_LOOP = r"""
+sub __webrepl_run { eval "package main; use strict; no strict 'vars'; use warnings;\n#line 1\n$_[0]\n;1" }
+$| = 1;
+# Commands arrive on a duplicate of the original stdin; user code gets
+# /dev/null as STDIN so reading it can't consume (or wait on) the protocol
+open(my $commands, '<&', \*STDIN) or die "dup stdin: $!";
+open(STDIN, '<', '/dev/null') or die "reopen stdin: $!";
+binmode $commands;
+my $sentinel = shift @ARGV;
+while (defined(my $len = <$commands>)) {
+    chomp $len;
+    my $src = '';
+    last unless read($commands, $src, $len) == $len;
+    $. = 0;  # keep "<$commands> line N" out of error messages
+    my $ok = __webrepl_run($src);
+    print STDERR $@ unless $ok;
+    print STDOUT $sentinel . ($ok ? 0 : 1);
+    print STDERR $sentinel;
+}
+"""
+
+
+class PerlProcess:
+    """A long-lived perl interpreter holding one session's state"""
+
+    def __init__(self, proc: asyncio.subprocess.Process, sentinel: bytes):
+        self.proc = proc
+        self.sentinel = sentinel
+
+    @classmethod
+    async def spawn(cls, working_dir: str) -> "PerlProcess":
+        sentinel = f"\x1e{secrets.token_hex(8)}".encode()
+        proc = await asyncio.create_subprocess_exec(
+            "perl", "-I", working_dir, "-e", PERL_REPL_LOOP, sentinel,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=working_dir,
+            # Own process group, so a timeout also kills anything the code spawned
+            start_new_session=True
+        )
+        return cls(proc, sentinel)
+
+    async def _read_until_sentinel(self, stream: asyncio.StreamReader) -> Tuple[bytes, Optional[bytes]]:
+        """Read up to the sentinel; returns (data, status) with status None on EOF."""
+        buffer = bytearray()
+        while self.sentinel not in buffer:
+            chunk = await stream.read(65536)
+            if not chunk:
+                return bytes(buffer), None
+            buffer += chunk
+        data, _, status = bytes(buffer).partition(self.sentinel)
+        return data, status
+
+    async def run(self, source: bytes) -> Tuple[str, str, bool]:
+        """Evaluate UTF-8 encoded code; returns (stdout, stderr, succeeded).
+
+        If the code exits the interpreter, whatever it wrote is returned and
+        the process is left dead (see `alive`).
+        """
+        self.proc.stdin.write(b"".join((str(len(source)).encode(), b"\n", source)))
+        await self.proc.stdin.drain()
+
+        (stdout, status), (stderr, _) = await asyncio.gather(
+            self._read_until_sentinel(self.proc.stdout),
+            self._read_until_sentinel(self.proc.stderr)
+        )
+        if status is None:
+            # The code called exit (or perl died); report its exit status
+            succeeded = await self.proc.wait() == 0
+        else:
+            succeeded = status.startswith(b"0")
+        return (
+            stdout.decode("utf-8", errors="replace"),
+            stderr.decode("utf-8", errors="replace"),
+            succeeded
+        )
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.returncode is None
+
+    async def kill(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await self.proc.wait()
 
 class ExecutionResponse(BaseModel):
     output: str
@@ -55,144 +213,171 @@ class ExecutionResponse(BaseModel):
 
 def get_session_dir(session_id: str) -> Path:
     """Get or create the session directory for a given session ID."""
-    session_dir = Path(f"/tmp/perl_sessions/{session_id}")
+    session_dir = Path(f"{SESSIONS_ROOT}/{session_id}")
     session_dir.mkdir(parents=True, exist_ok=True)
     return session_dir
 
-def get_or_create_session(session_id: str) -> Dict:
+async def evict_session(session_id: str):
+    """Stop a session's interpreter and remove its files and metadata."""
+    session = sessions.pop(session_id)
+    await _discard_process(session)
+    os.close(session["history_fd"])
+    shutil.rmtree(session["working_dir"], ignore_errors=True)
+    logger.info(f"Evicted Perl session: {session_id}")
+
+async def get_or_create_session(session_id: str) -> Dict:
     """Get or create a session for the given session ID."""
     if session_id not in sessions:
         session_dir = get_session_dir(session_id)
         sessions[session_id] = {
-            "created_at": datetime.now().isoformat(),
-            "last_accessed": datetime.now().isoformat(),
+            "created_at_ns": time.time_ns(),
+            "last_accessed_ns": time.time_ns(),
             "execution_count": 0,
             "working_dir": str(session_dir),
-            "history_file": str(session_dir / "history.pl")
+            "history_file": str(session_dir / "history.pl"),
+            "history_fd": None,
+            "process": None,
+            "lock": asyncio.Lock()
         }
         logger.info(f"Created new Perl session: {session_id}")
         
-        # Initialize history file with strict mode and warnings
-        history_file = Path(sessions[session_id]["history_file"])
-        history_file.write_text("#!/usr/bin/perl\nuse strict;\nuse warnings;\n\n")
+        # Initialize history file with strict mode and warnings, keeping the
+        # handle open so each execution is a single append
+        history_fd = os.open(
+            sessions[session_id]["history_file"],
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND | os.O_CLOEXEC,
+            0o600
+        )
+        os.write(history_fd, _PERL_HEADER)
+        sessions[session_id]["history_fd"] = history_fd
+        
+        # Bound memory, interpreter processes and disk use
+        while len(sessions) > MAX_SESSIONS:
+            await evict_session(next(iter(sessions)))
     
     # Update last accessed time
-    sessions[session_id]["last_accessed"] = datetime.now().isoformat()
+    sessions[session_id]["last_accessed_ns"] = time.time_ns()
+    sessions.move_to_end(session_id)
     return sessions[session_id]
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "language": "perl", "sessions": len(sessions)}
 
 @app.post("/execute/{session_id}", response_model=ExecutionResponse)
-def execute_code(session_id: str, request: CodeRequest):
+async def execute_code(session_id: str, request: Request):
     """Execute Perl code in a session-isolated environment."""
-    if not request.code.strip():
+    # Parse the one-field body directly rather than through a Pydantic model
+    try:
+        code = orjson.loads(await request.body())["code"]
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        raise HTTPException(status_code=422, detail="Request body must be a JSON object with a 'code' string")
+    if not isinstance(code, str):
+        raise HTTPException(status_code=422, detail="Request body must be a JSON object with a 'code' string")
+    if not code or code.isspace():
         raise HTTPException(status_code=400, detail="Code cannot be empty")
     
-    session = get_or_create_session(session_id)
+    session = await get_or_create_session(session_id)
     session["execution_count"] += 1
     
-    try:
-        # Create a temporary file with just the new code
-        with tempfile.NamedTemporaryFile(
-            mode='w',
-            suffix='.pl',
-            dir=session["working_dir"],
-            delete=False
-        ) as temp_file:
-            # Write the strict mode and warnings header
-            temp_file.write("#!/usr/bin/perl\nuse strict;\nuse warnings;\n\n")
+    # Encode once; the same bytes go to the interpreter and the history file
+    source = code.encode("utf-8")
+    
+    async with session["lock"]:
+        try:
+            # Reuse the session's perl interpreter instead of starting a new one
+            if session["process"] is None:
+                session["process"] = await PerlProcess.spawn(session["working_dir"])
+            output, stderr, succeeded = await asyncio.wait_for(
+                session["process"].run(source),
+                timeout=EXECUTION_TIMEOUT
+            )
+            if not session["process"].alive:
+                await _discard_process(session)
             
-            # Add the new code
-            temp_file.write(f"# Execution {session['execution_count']}\n")
-            temp_file.write(request.code)
-            if not request.code.endswith('\n'):
-                temp_file.write('\n')
-            temp_file.flush()
-            temp_path = temp_file.name
-        
-        # Execute the Perl script
-        result = subprocess.run(
-            ["perl", temp_path],
-            capture_output=True,
-            text=True,
-            cwd=session["working_dir"],
-            timeout=30
-        )
-        
-        # If execution was successful, append the code to history
-        if result.returncode == 0:
-            history_file = Path(session["history_file"])
-            with open(history_file, 'a') as f:
-                f.write(f"\n# Execution {session['execution_count']}\n")
-                f.write(request.code)
-                if not request.code.endswith('\n'):
-                    f.write('\n')
-        
-        # Clean up temp file
-        os.unlink(temp_path)
-        
-        # Combine stdout and stderr for output
-        output = result.stdout
-        error = result.stderr if result.returncode != 0 else None
-        
-        logger.info(f"Session {session_id}: Executed Perl code (execution #{session['execution_count']})")
-        
-        return ExecutionResponse(
-            output=output or "",
-            error=error
-        )
-        
-    except subprocess.TimeoutExpired:
-        logger.warning(f"Session {session_id}: Code execution timed out")
-        return ExecutionResponse(
-            output="",
-            error="Execution timed out after 30 seconds"
-        )
-    except Exception as e:
-        logger.error(f"Session {session_id}: Execution error: {str(e)}")
-        return ExecutionResponse(
-            output="",
-            error=str(e)
-        )
+            # If execution was successful, append the code to history
+            if succeeded:
+                os.write(session["history_fd"], b"".join((
+                    _EXECUTION_MARKER % session["execution_count"],
+                    source,
+                    b"" if source.endswith(b"\n") else b"\n",
+                )))
+            
+            error = stderr if not succeeded else None
+            
+            logger.info(f"Session {session_id}: Executed Perl code (execution #{session['execution_count']})")
+            
+            return ExecutionResponse(
+                output=output or "",
+                error=error
+            )
+            
+        except asyncio.TimeoutError:
+            logger.warning(f"Session {session_id}: Code execution timed out")
+            await _discard_process(session)
+            return ExecutionResponse(
+                output="",
+                error="Execution timed out after 30 seconds"
+            )
+        except Exception as e:
+            logger.error(f"Session {session_id}: Execution error: {str(e)}")
+            await _discard_process(session)
+            return ExecutionResponse(
+                output="",
+                error=str(e)
+            )
+
+async def _discard_process(session: Dict):
+    """Kill a session's perl process; a fresh one starts on the next execution"""
+    if session["process"] is not None:
+        await session["process"].kill()
+        session["process"] = None
 
 @app.post("/reset/{session_id}")
-def reset_session(session_id: str):
+async def reset_session(session_id: str):
     """Reset the session state for a given session ID."""
     if session_id in sessions:
-        session_dir = Path(sessions[session_id]["working_dir"])
+        await _discard_process(sessions[session_id])
+        os.close(sessions[session_id]["history_fd"])
+        session_dir = sessions[session_id]["working_dir"]
         
-        # Remove all files in the session directory
-        if session_dir.exists():
-            for file in session_dir.iterdir():
-                if file.is_file():
-                    file.unlink()
-                elif file.is_dir():
-                    import shutil
-                    shutil.rmtree(file)
+        # Remove all files in the session directory; scandir's cached entry
+        # types avoid a stat per file
+        try:
+            with os.scandir(session_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
         
         # Remove session from memory
         del sessions[session_id]
         logger.info(f"Reset Perl session: {session_id}")
         
         # Recreate the session
-        get_or_create_session(session_id)
+        await get_or_create_session(session_id)
         
         return {"message": "Session reset successfully"}
     else:
         return {"message": "Session not found, creating new session"}
 
+def _format_timestamp(ns: int) -> str:
+    """Format a time.time_ns() timestamp as an ISO 8601 string."""
+    return datetime.fromtimestamp(ns / 1e9).isoformat()
+
 @app.get("/sessions")
-def list_sessions():
+async def list_sessions():
     """List all active sessions."""
     return {
         "sessions": [
             {
                 "id": session_id,
-                "created_at": data["created_at"],
-                "last_accessed": data["last_accessed"],
+                "created_at": _format_timestamp(data["created_at_ns"]),
+                "last_accessed": _format_timestamp(data["last_accessed_ns"]),
                 "execution_count": data["execution_count"]
             }
             for session_id, data in sessions.items()
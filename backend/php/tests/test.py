@@ -1,5 +1,6 @@
 import pytest
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
 import uuid
@@ -10,45 +11,74 @@ BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
 SESSION_MANAGER_URL = os.getenv("SESSION_MANAGER_URL", "http://localhost:8000")
 REQUEST_TIMEOUT = 10  # seconds
 
+# Shared HTTP session so connections are kept alive across tests. Created
+# lazily by the fixture below so each test process gets its own pool.
+SESSION = None
 
-class TestPHPBackend:
-    """Test suite for PHP backend webserver"""
 
-    def setup_method(self):
-        """Setup before each test - create a test session"""
-        # Create a unique test session for each test
-        self.test_session_id = str(uuid.uuid4())
+@pytest.fixture(scope="session", autouse=True)
+def http_session():
+    """Create the shared HTTP session and close it at the end"""
+    global SESSION
+    SESSION = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=0)
+    SESSION.mount("http://", adapter)
+    SESSION.mount("https://", adapter)
+    yield SESSION
+    SESSION.close()
+
+
+@pytest.fixture(scope="session")
+def php_session(http_session):
+    """Create one PHP session shared by the whole test run"""
+    session_id = str(uuid.uuid4())
+    
+    # Create session via session manager
+    try:
+        response = SESSION.post(
+            f"{SESSION_MANAGER_URL}/sessions",
+            json={
+                "name": f"Test Session {session_id[:8]}",
+                "language": "php"
+            },
+            timeout=5
+        )
+        if response.status_code not in (200, 201):
+            raise Exception(f"Failed to create session: {response.status_code} - {response.text}")
         
-        # Create session via session manager
-        try:
-            response = requests.post(
-                f"{SESSION_MANAGER_URL}/sessions",
-                json={
-                    "name": f"Test Session {self.test_session_id[:8]}",
-                    "language": "php"
-                },
-                timeout=5
-            )
-            if response.status_code not in (200, 201):
-                raise Exception(f"Failed to create session: {response.status_code} - {response.text}")
-            
-            # Use the session ID returned by the session manager
-            session_data = response.json()
-            self.test_session_id = session_data["id"]
-            assert session_data["language"] == "php"
-        except Exception as e:
-            pytest.fail(f"Failed to setup test session: {e}")
+        # Use the session ID returned by the session manager
+        session_data = response.json()
+        session_id = session_data["id"]
+        assert session_data["language"] == "php"
+    except Exception as e:
+        pytest.fail(f"Failed to setup test session: {e}")
+    
+    yield session_id
+    
+    # Cleanup once every test has run
+    try:
+        SESSION.delete(f"{SESSION_MANAGER_URL}/sessions/{session_id}", timeout=5)
+    except requests.exceptions.RequestException:
+        pass  # Ignore cleanup errors
 
-    def teardown_method(self):
-        """Cleanup after each test - delete the test session"""
-        try:
-            requests.delete(f"{SESSION_MANAGER_URL}/sessions/{self.test_session_id}", timeout=5)
-        except:
-            pass  # Ignore cleanup errors
 
+class TestPHPBackend:
+    """Test suite for PHP backend webserver"""
+
+    @pytest.fixture(autouse=True)
+    def clean_context(self, request, php_session):
+        """Point the test at the shared session, resetting it unless marked dirty_ok"""
+        self.test_session_id = php_session
+        if request.node.get_closest_marker("dirty_ok") is None:
+            try:
+                SESSION.post(f"{BASE_URL}/reset/{php_session}", timeout=5)
+            except requests.exceptions.RequestException:
+                pass
+
+    @pytest.mark.dirty_ok
     def test_health_endpoint(self):
         """Test that the health endpoint returns correct status"""
-        response = requests.get(f"{BASE_URL}/health", timeout=REQUEST_TIMEOUT)
+        response = SESSION.get(f"{BASE_URL}/health", timeout=REQUEST_TIMEOUT)
         assert response.status_code == 200
         
         data = response.json()
@@ -59,7 +89,7 @@ class TestPHPBackend:
 
     def test_basic_execution(self):
         """Test basic PHP code execution"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "echo 'Hello, World!';"},
             timeout=REQUEST_TIMEOUT
@@ -73,7 +103,7 @@ class TestPHPBackend:
     def test_variable_assignment_and_persistence(self):
         """Test that variables persist between executions"""
         # Set a variable
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "$x = 42;"},
             timeout=REQUEST_TIMEOUT
@@ -81,7 +111,7 @@ class TestPHPBackend:
         assert response.status_code == 200
         
         # Use the variable in another execution
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "echo $x;"},
             timeout=REQUEST_TIMEOUT
@@ -95,7 +125,7 @@ class TestPHPBackend:
     def test_function_definition(self):
         """Test that functions can be defined and called in single execution"""
         # Define and call function in same execution
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "function greet($name) { return 'Hello, ' . $name . '!'; } echo greet('PHP');"},
             timeout=REQUEST_TIMEOUT
@@ -109,7 +139,7 @@ class TestPHPBackend:
     def test_class_definition_and_usage(self):
         """Test class definition and object creation in single execution"""
         # Define class and create instance in same execution
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": """
 class Person {
@@ -138,7 +168,7 @@ echo $person->greeting();
 
     def test_array_operations(self):
         """Test array creation and manipulation"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "$arr = [1, 2, 3, 4, 5]; echo implode(', ', $arr);"},
             timeout=REQUEST_TIMEOUT
@@ -151,7 +181,7 @@ echo $person->greeting();
 
     def test_associative_arrays(self):
         """Test associative array operations"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "$data = ['name' => 'Bob', 'age' => 25]; echo $data['name'] . ' is ' . $data['age'] . ' years old';"},
             timeout=REQUEST_TIMEOUT
@@ -164,7 +194,7 @@ echo $person->greeting();
 
     def test_built_in_functions(self):
         """Test PHP built-in functions"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "echo strlen('Hello, World!');"},
             timeout=REQUEST_TIMEOUT
@@ -177,7 +207,7 @@ echo $person->greeting();
 
     def test_string_operations(self):
         """Test string manipulation functions"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "$text = 'Hello World'; echo strtoupper(strrev($text));"},
             timeout=REQUEST_TIMEOUT
@@ -190,7 +220,7 @@ echo $person->greeting();
 
     def test_control_structures(self):
         """Test if statements and loops"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "for ($i = 1; $i <= 3; $i++) { echo $i . ' '; }"},
             timeout=REQUEST_TIMEOUT
@@ -203,7 +233,7 @@ echo $person->greeting();
 
     def test_json_operations(self):
         """Test JSON encoding and decoding"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "$array = ['key' => 'value', 'number' => 42]; echo json_encode($array);"},
             timeout=REQUEST_TIMEOUT
@@ -219,7 +249,7 @@ echo $person->greeting();
 
     def test_expression_evaluation(self):
         """Test that expressions return values"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "2 + 2"},
             timeout=REQUEST_TIMEOUT
@@ -233,13 +263,13 @@ echo $person->greeting();
 
     def test_syntax_error_handling(self):
         """Test that syntax errors are properly caught"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "echo 'missing semicolon'"},
             timeout=REQUEST_TIMEOUT
         )
         # This might not be a syntax error in PHP, let's try a real syntax error
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "if (true { echo 'missing closing parenthesis'; }"},
             timeout=REQUEST_TIMEOUT
@@ -252,7 +282,7 @@ echo $person->greeting();
 
     def test_runtime_error_handling(self):
         """Test that runtime errors are properly caught"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "echo $undefined_variable;"},
             timeout=REQUEST_TIMEOUT
@@ -261,7 +291,7 @@ echo $person->greeting();
         
         data = response.json()
         # PHP might not throw error for undefined variables, let's try division by zero
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "throw new Exception('Test exception');"},
             timeout=REQUEST_TIMEOUT
@@ -276,7 +306,7 @@ echo $person->greeting();
         """Test that different sessions don't share variables"""
         # Create another session for comparison
         other_session_id = str(uuid.uuid4())
-        response = requests.post(
+        response = SESSION.post(
             f"{SESSION_MANAGER_URL}/sessions",
             json={
                 "name": f"Other Session {other_session_id[:8]}",
@@ -290,7 +320,7 @@ echo $person->greeting();
         
         try:
             # Set variable in first session
-            response = requests.post(
+            response = SESSION.post(
                 f"{BASE_URL}/execute/{self.test_session_id}",
                 json={"code": "$isolation_test = 'session1';"},
                 timeout=REQUEST_TIMEOUT
@@ -298,7 +328,7 @@ echo $person->greeting();
             assert response.status_code == 200
             
             # Try to access it from second session (should fail or be empty)
-            response = requests.post(
+            response = SESSION.post(
                 f"{BASE_URL}/execute/{other_session_id}",
                 json={"code": "echo isset($isolation_test) ? $isolation_test : 'not_found';"},
                 timeout=REQUEST_TIMEOUT
@@ -310,12 +340,12 @@ echo $person->greeting();
             assert data["error"] is None
         finally:
             # Clean up other session
-            requests.delete(f"{SESSION_MANAGER_URL}/sessions/{other_session_id}", timeout=5)
+            SESSION.delete(f"{SESSION_MANAGER_URL}/sessions/{other_session_id}", timeout=5)
 
     def test_session_reset(self):
         """Test that session reset clears variables"""
         # Set a variable
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "$reset_test = 'should_be_cleared';"},
             timeout=REQUEST_TIMEOUT
@@ -323,7 +353,7 @@ echo $person->greeting();
         assert response.status_code == 200
         
         # Reset the session
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/reset/{self.test_session_id}",
             timeout=REQUEST_TIMEOUT
         )
@@ -333,7 +363,7 @@ echo $person->greeting();
         assert "reset" in data["message"].lower()
         
         # Try to access the variable (should be gone)
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "echo isset($reset_test) ? $reset_test : 'variable_cleared';"},
             timeout=REQUEST_TIMEOUT
@@ -344,9 +374,10 @@ echo $person->greeting();
         assert data["output"] == "variable_cleared"
         assert data["error"] is None
 
+    @pytest.mark.dirty_ok
     def test_empty_code_validation(self):
         """Test that empty code returns appropriate error"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": ""},
             timeout=REQUEST_TIMEOUT
@@ -357,9 +388,10 @@ echo $person->greeting();
         assert data["error"] is not None
         assert "empty" in data["error"].lower()
 
+    @pytest.mark.dirty_ok
     def test_whitespace_only_code_validation(self):
         """Test that whitespace-only code returns appropriate error"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "   \n\t  "},
             timeout=REQUEST_TIMEOUT
@@ -372,7 +404,7 @@ echo $person->greeting();
 
     def test_complex_php_features(self):
         """Test advanced PHP features like closures"""
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{self.test_session_id}",
             json={"code": "$numbers = [1, 2, 3, 4, 5]; $doubled = array_map(function($n) { return $n * 2; }, $numbers); echo implode(', ', $doubled);"},
             timeout=REQUEST_TIMEOUT
@@ -383,11 +415,12 @@ echo $person->greeting();
         assert data["output"] == "2, 4, 6, 8, 10"
         assert data["error"] is None
 
+    @pytest.mark.dirty_ok
     def test_wrong_session_language(self):
         """Test behavior when session is created for different language"""
         # Create a session for a different language
         wrong_session_id = str(uuid.uuid4())
-        response = requests.post(
+        response = SESSION.post(
             f"{SESSION_MANAGER_URL}/sessions",
             json={
                 "name": f"Wrong Language Session {wrong_session_id[:8]}",
@@ -399,7 +432,7 @@ echo $person->greeting();
         try:
             if response.status_code in (200, 201):
                 # Try to execute PHP code in a Python session
-                response = requests.post(
+                response = SESSION.post(
                     f"{BASE_URL}/execute/{wrong_session_id}",
                     json={"code": "echo 'This should fail';"},
                     timeout=REQUEST_TIMEOUT
@@ -411,13 +444,14 @@ echo $person->greeting();
                 assert "not configured for php" in data["error"].lower()
         finally:
             # Clean up wrong session
-            requests.delete(f"{SESSION_MANAGER_URL}/sessions/{wrong_session_id}", timeout=5)
+            SESSION.delete(f"{SESSION_MANAGER_URL}/sessions/{wrong_session_id}", timeout=5)
 
+    @pytest.mark.dirty_ok
     def test_invalid_session_handling(self):
         """Test behavior with non-existent session ID"""
         fake_session_id = str(uuid.uuid4())
         
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/execute/{fake_session_id}",
             json={"code": "echo 'test';"},
             timeout=REQUEST_TIMEOUT
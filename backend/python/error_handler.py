@@ -4,10 +4,15 @@ Standardized Error Handling for Python REPL Backend
 Provides consistent error responses and proper HTTP status codes.
 """
 
+import os
 import traceback
-from typing import Optional, Dict, Any
+from typing import Final, Optional, Dict, Any
 from enum import Enum
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+
+# Attach formatted tracebacks to execution errors (off by default; user code
+# errors are frequent and only the message is returned to clients)
+INCLUDE_TRACEBACK = os.getenv("REPL_INCLUDE_TRACEBACK", "false").lower() in ("1", "true", "yes")
 
 
 class ErrorType(str, Enum):
@@ -21,6 +26,8 @@ class ErrorType(str, Enum):
 
 class ErrorResponse(BaseModel):
     """Standardized error response format"""
+    model_config = ConfigDict(extra='forbid')
+    
     error_type: ErrorType
     message: str
     details: Optional[str] = None
@@ -30,6 +37,8 @@ class ErrorResponse(BaseModel):
 
 class ExecutionResult(BaseModel):
     """Standardized execution result"""
+    model_config = ConfigDict(extra='forbid')
+    
     output: str = ""
     error: Optional[str] = None
     error_type: Optional[ErrorType] = None
@@ -37,12 +46,16 @@ class ExecutionResult(BaseModel):
 
 
 class ErrorHandler:
-    """Centralized error handling with consistent responses"""
+    """Centralized error handling with consistent responses
+
+    Responses are built with model_construct: every field comes from this
+    module, so pydantic validation would only repeat work.
+    """
     
     @staticmethod
     def handle_validation_error(message: str, session_id: Optional[str] = None) -> ErrorResponse:
         """Handle validation errors (400)"""
-        return ErrorResponse(
+        return ErrorResponse.model_construct(
             error_type=ErrorType.VALIDATION_ERROR,
             message=message,
             session_id=session_id
@@ -50,16 +63,16 @@ class ErrorHandler:
     
     @staticmethod
     def handle_execution_error(
-        exception: Exception, 
+        exception: BaseException, 
         session_id: Optional[str] = None,
-        include_traceback: bool = True
+        include_traceback: bool = False
     ) -> ErrorResponse:
         """Handle code execution errors"""
         details = None
         if include_traceback:
-            details = traceback.format_exc()
+            details = ''.join(traceback.format_exception(exception))
         
-        return ErrorResponse(
+        return ErrorResponse.model_construct(
             error_type=ErrorType.EXECUTION_ERROR,
             message=f"{type(exception).__name__}: {str(exception)}",
             details=details,
@@ -69,7 +82,7 @@ class ErrorHandler:
     @staticmethod
     def handle_session_error(message: str, session_id: str) -> ErrorResponse:
         """Handle session-related errors"""
-        return ErrorResponse(
+        return ErrorResponse.model_construct(
             error_type=ErrorType.SESSION_ERROR,
             message=message,
             session_id=session_id
@@ -81,7 +94,7 @@ class ErrorHandler:
         session_id: Optional[str] = None
     ) -> ErrorResponse:
         """Handle internal server errors (500)"""
-        return ErrorResponse(
+        return ErrorResponse.model_construct(
             error_type=ErrorType.INTERNAL_ERROR,
             message="Internal server error occurred",
             details=str(exception),
@@ -91,28 +104,32 @@ class ErrorHandler:
     @staticmethod
     def format_execution_result(
         output: str = "",
-        error: Optional[Exception] = None,
+        error: Optional[BaseException] = None,
         session_id: Optional[str] = None,
         session_info: Optional[Dict[str, Any]] = None
     ) -> ExecutionResult:
         """Format execution result with proper error handling"""
-        result = ExecutionResult(output=output, session_info=session_info)
+        result = ExecutionResult.model_construct(output=output, session_info=session_info)
         
         if error:
-            error_response = ErrorHandler.handle_execution_error(error, session_id)
+            error_response = ErrorHandler.handle_execution_error(
+                error, session_id, include_traceback=INCLUDE_TRACEBACK
+            )
             result.error = error_response.message
             result.error_type = error_response.error_type
         
         return result
 
 
+_STATUS_MAP: Final[Dict[ErrorType, int]] = {
+    ErrorType.VALIDATION_ERROR: 400,
+    ErrorType.EXECUTION_ERROR: 200,  # Execution errors are expected, return 200
+    ErrorType.SESSION_ERROR: 404,
+    ErrorType.INTERNAL_ERROR: 500,
+    ErrorType.TIMEOUT_ERROR: 408,
+}
+
+
 def get_http_status_for_error_type(error_type: ErrorType) -> int:
     """Get appropriate HTTP status code for error type"""
-    status_map = {
-        ErrorType.VALIDATION_ERROR: 400,
-        ErrorType.EXECUTION_ERROR: 200,  # Execution errors are expected, return 200
-        ErrorType.SESSION_ERROR: 404,
-        ErrorType.INTERNAL_ERROR: 500,
-        ErrorType.TIMEOUT_ERROR: 408,
-    }
-    return status_map.get(error_type, 500)
\ No newline at end of file
+    return _STATUS_MAP.get(error_type, 500)
\ No newline at end of file
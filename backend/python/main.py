@@ -1,21 +1,34 @@
+import ast
+import contextlib
+import hashlib
+import importlib
 import io
 import os
 import sys
 import logging
-import base64
 import pickle
+import pickletools
 import asyncio
-import json
+import builtins
 import threading
 import time
-from typing import Any, Dict, AsyncGenerator, Optional
+import traceback
+import zlib
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from types import (
+    AsyncGeneratorType, CodeType, CoroutineType, FrameType, FunctionType,
+    GeneratorType, ModuleType, TracebackType,
+)
+from typing import Any, Dict, AsyncGenerator, Iterator, List, Optional, Set, TextIO, Tuple
 from datetime import datetime
 import httpx
+import orjson
 
-from fastapi import FastAPI, HTTPException, Path
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Path, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict
 
 from error_handler import ErrorHandler, ErrorType, ExecutionResult, get_http_status_for_error_type
 
@@ -26,68 +39,263 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Session Manager URL
+SESSION_MANAGER_URL = os.getenv("SESSION_MANAGER_URL", "http://session-manager:8000")
+
+# The highest protocol (5 on supported Pythons) frames large bytes-like values
+# without the extra copies the default protocol makes and emits more compact
+# opcodes; state is only ever read back by this same image
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+# Pickles larger than this are zlib-compressed before being sent to the
+# session manager; level 1 trades a little ratio for speed on the save path
+COMPRESS_MIN_BYTES = int(os.getenv("NAMESPACE_COMPRESS_MIN_BYTES", "4096"))
+COMPRESS_LEVEL = 1
+
+# pickletools.optimize drops unused memo opcodes but is pure Python, so it is
+# only run on pickles small enough for the pass to be cheap
+OPTIMIZE_MAX_BYTES = 64 << 10
+
+# Compiled code objects keyed by a digest of the source, so resubmitted code
+# skips parsing and compilation
+CODE_CACHE_SIZE = int(os.getenv("CODE_CACHE_SIZE", "256"))
+_code_cache: "OrderedDict[bytes, Tuple[str, CodeType, bool]]" = OrderedDict()
+_code_cache_lock = threading.Lock()
+
+# Size limits for the persisted namespace; variables that would exceed them
+# are left out of the saved state rather than pickled and shipped every request
+MAX_VARIABLE_BYTES = int(os.getenv("MAX_VARIABLE_BYTES", str(8 << 20)))
+MAX_NAMESPACE_BYTES = int(os.getenv("MAX_NAMESPACE_BYTES", str(32 << 20)))
+
+# Characters of output kept per /execute call; anything beyond is dropped
+MAX_OUTPUT_CHARS = int(os.getenv("MAX_OUTPUT_CHARS", str(1 << 20)))
+
+# Shared client for all session manager calls, so requests reuse pooled
+# keep-alive connections instead of opening a new one each time
+CLIENT: Optional[httpx.AsyncClient] = None
+
+# Where sys.stdout/sys.stderr writes go for the current request (or streaming
+# thread); unset means the real stream
+_stdout_target: ContextVar[Optional[TextIO]] = ContextVar("stdout_target", default=None)
+_stderr_target: ContextVar[Optional[TextIO]] = ContextVar("stderr_target", default=None)
+
+
+class ContextStream:
+    """Stand-in for sys.stdout/sys.stderr that writes to the current context's target
+
+    Installed once at startup, so concurrent executions each capture their own
+    output instead of swapping the process-wide streams.
+    """
+    def __init__(self, target: ContextVar, fallback: TextIO):
+        self._target = target
+        self._fallback = fallback
+    
+    def _stream(self) -> TextIO:
+        return self._target.get() or self._fallback
+    
+    def write(self, text: str) -> int:
+        return self._stream().write(text)
+    
+    def flush(self) -> None:
+        self._stream().flush()
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream(), name)
+
+
+@contextlib.contextmanager
+def capture_output(stdout: TextIO, stderr: TextIO) -> Iterator[None]:
+    """Route this context's sys.stdout and sys.stderr writes to the given streams"""
+    stdout_token = _stdout_target.set(stdout)
+    stderr_token = _stderr_target.set(stderr)
+    try:
+        yield
+    finally:
+        _stdout_target.reset(stdout_token)
+        _stderr_target.reset(stderr_token)
+
+# Activity pings still in flight; holding a reference keeps them from being
+# garbage collected before they finish
+_background_tasks: Set[asyncio.Task] = set()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global CLIENT
+    real_stdout, real_stderr = sys.stdout, sys.stderr
+    sys.stdout = ContextStream(_stdout_target, real_stdout)
+    sys.stderr = ContextStream(_stderr_target, real_stderr)
+    CLIENT = httpx.AsyncClient(
+        base_url=SESSION_MANAGER_URL,
+        timeout=httpx.Timeout(10.0),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=100, keepalive_expiry=15.0),
+    )
+    yield
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+    await CLIENT.aclose()
+    sys.stdout, sys.stderr = real_stdout, real_stderr
+
 app = FastAPI(
     title="Python REPL API",
     description="Session-based Python REPL with automatic cleanup and monitoring",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
-# Session Manager URL
-SESSION_MANAGER_URL = os.getenv("SESSION_MANAGER_URL", "http://session-manager:8000")
+# Values of these types never pickle, so they are left out of the saved
+# namespace without attempting it
+_UNPICKLABLE_TYPES = (
+    GeneratorType, CoroutineType, AsyncGeneratorType, FrameType, TracebackType,
+    io.IOBase, type(threading.Lock()), type(threading.RLock()),
+)
+
+# Py_TPFLAGS_HEAPTYPE: set on classes created at runtime by a class statement
+_TPFLAGS_HEAPTYPE = 1 << 9
+
+def is_repl_defined(cls: type) -> bool:
+    """Whether a class was defined by user code, so pickle can't find it by name
+
+    Classes created by exec() in a namespace without __name__ report the
+    builtins module, where no such attribute exists. Built-in C types such as
+    module also report builtins but are not heap types.
+    """
+    return (
+        cls.__flags__ & _TPFLAGS_HEAPTYPE != 0
+        and cls.__module__ == "builtins"
+        and getattr(builtins, cls.__qualname__, None) is not cls
+    )
 
-async def serialize_namespace(namespace: Dict[str, Any]) -> str:
-    """Serialize a Python namespace to base64-encoded string"""
-    logger.error(f"ENTERING serialize_namespace with {len(namespace)} items")
+def is_unpicklable(value: Any) -> bool:
+    """Cheaply recognize values that pickle is certain to reject
+
+    Catches the common cases (generators, open files, functions and classes
+    defined in the REPL, and their instances) so they are skipped without
+    raising and catching a PicklingError; anything else is left to pickle.
+    """
+    if isinstance(value, _UNPICKLABLE_TYPES):
+        return True
+    if isinstance(value, FunctionType):
+        # Functions pickle by reference, which needs an importable module
+        return value.__module__ is None or "<" in value.__qualname__
+    if isinstance(value, type):
+        return is_repl_defined(value)
+    return is_repl_defined(type(value))
+
+class NamespacePickler(pickle.Pickler):
+    """Pickler that stores modules by name so they are re-imported on load
+
+    This lets a namespace holding imported modules, even inside containers,
+    be pickled in a single pass.
+    """
+    def reducer_override(self, obj: Any) -> Any:
+        if isinstance(obj, ModuleType):
+            return importlib.import_module, (obj.__name__,)
+        return NotImplemented
+
+def optimize_pickle(data: bytes) -> bytes:
+    """Strip unused memo entries from a small pickle"""
+    if len(data) > OPTIMIZE_MAX_BYTES:
+        return data
+    return pickletools.optimize(data)
+
+def compress_namespace(data: bytes) -> bytes:
+    """Compress a pickled namespace if it is large enough to be worth it"""
+    if len(data) < COMPRESS_MIN_BYTES:
+        return data
+    return zlib.compress(data, COMPRESS_LEVEL)
+
+def decompress_namespace(data: bytes) -> bytes:
+    """Undo compress_namespace; uncompressed pickles are returned unchanged
+
+    Pickles written with protocol 2 or later start with the PROTO opcode
+    (0x80), which never begins a zlib stream.
+    """
+    if data[:1] == b"\x80":
+        return data
+    return zlib.decompress(data)
+
+def pickle_value(value: Any) -> bytes:
+    """Pickle a value with NamespacePickler"""
+    buffer = io.BytesIO()
+    NamespacePickler(buffer, protocol=PICKLE_PROTOCOL).dump(value)
+    return buffer.getvalue()
+
+def serialize_namespace_sync(namespace: Dict[str, Any], dropped: Optional[List[str]] = None) -> bytes:
+    """Serialize a Python namespace to pickle bytes, compressed when large
+
+    Variables larger than MAX_VARIABLE_BYTES, or that would take the total past
+    MAX_NAMESPACE_BYTES, are skipped and their names appended to dropped.
+    """
+    debug = logger.isEnabledFor(logging.DEBUG)
+    candidates = {
+        key: value for key, value in namespace.items()
+        if not key.startswith('__') and not is_unpicklable(value)
+    }
+    
+    # Usually everything pickles and is small, so try the whole namespace in
+    # one pass; a result within the per-variable limit satisfies both limits
+    try:
+        result = pickle_value(candidates)
+        if len(result) <= min(MAX_VARIABLE_BYTES, MAX_NAMESPACE_BYTES):
+            if debug:
+                logger.debug("Serialized %s variables in one pass: %s bytes", len(candidates), len(result))
+            return compress_namespace(optimize_pickle(result))
+    except Exception as pickle_error:
+        if debug:
+            logger.debug("Cannot pickle namespace in one pass: %s", pickle_error)
+    
     try:
-        # Filter out non-serializable objects like modules, functions, etc.
+        # Fall back to checking variables one at a time to find the ones to leave out
         serializable_namespace = {}
-        logger.error(f"About to iterate through namespace items")
+        total_size = 0
         
-        for key, value in namespace.items():
-            if key.startswith('__'):
-                continue  # Skip dunder variables
-            
-            logger.info(f"Processing {key}: {type(value)}")
+        for key, value in candidates.items():
+            # Cheap shallow check first, so huge bytes/str values are never pickled
+            if sys.getsizeof(value) > MAX_VARIABLE_BYTES:
+                if debug:
+                    logger.debug("Skipping oversized object %s", key)
+                if dropped is not None:
+                    dropped.append(key)
+                continue
             try:
-                # Test if the object can be pickled
-                test_result = pickle.dumps(value)
-                serializable_namespace[key] = value
-                logger.info(f"  ✓ Added {key} to serializable namespace")
+                size = len(pickle_value(value))
             except Exception as pickle_error:
-                logger.info(f"  ✗ Cannot pickle {key}: {pickle_error}")
-                # Handle modules specially - store module name for re-import
-                if hasattr(value, '__name__') and str(type(value)) == "<class 'module'>":
-                    module_key = f"__module__{key}"
-                    serializable_namespace[module_key] = value.__name__
-                    logger.info(f"  ✓ Stored module {key} as {module_key} = {value.__name__}")
-                else:
-                    logger.info(f"  ✗ Skipping non-serializable object {key}")
-                # Skip other non-serializable objects
+                if debug:
+                    logger.debug("Skipping non-serializable object %s: %s", key, pickle_error)
                 continue
+            
+            if size > MAX_VARIABLE_BYTES or total_size + size > MAX_NAMESPACE_BYTES:
+                if debug:
+                    logger.debug("Skipping oversized object %s", key)
+                if dropped is not None:
+                    dropped.append(key)
+                continue
+            total_size += size
+            serializable_namespace[key] = value
         
-        logger.info(f"Final serializable namespace: {list(serializable_namespace.keys())}")
         try:
-            serialized_bytes = pickle.dumps(serializable_namespace)
-            result = base64.b64encode(serialized_bytes).decode('utf-8')
-            logger.info(f"Serialization successful, result length: {len(result)}")
-            return result
+            result = pickle_value(serializable_namespace)
+            if debug:
+                logger.debug(
+                    "Serialized %s of %s variables: %s bytes",
+                    len(serializable_namespace), len(candidates), len(result)
+                )
+            return compress_namespace(optimize_pickle(result))
         except Exception as pickle_err:
-            logger.warning(f"Failed to pickle final namespace: {pickle_err}")
-            logger.warning(f"Namespace contents: {serializable_namespace}")
-            return ""
+            logger.warning("Failed to pickle final namespace: %s", pickle_err)
+            logger.warning("Namespace contents: %s", serializable_namespace)
+            return b""
     except Exception as e:
-        logger.warning(f"Failed to serialize namespace (outer): {e}")
-        import traceback
-        logger.warning(f"Traceback: {traceback.format_exc()}")
-        return ""
+        logger.warning("Failed to serialize namespace (outer): %s", e, exc_info=True)
+        return b""
 
-async def deserialize_namespace(serialized_data: str) -> Dict[str, Any]:
-    """Deserialize a base64-encoded string back to Python namespace"""
+def deserialize_namespace_sync(serialized_data: bytes) -> Dict[str, Any]:
+    """Deserialize pickle bytes back to Python namespace"""
     try:
         if not serialized_data:
             return {}
-        serialized_bytes = base64.b64decode(serialized_data.encode('utf-8'))
-        namespace = pickle.loads(serialized_bytes)
+        namespace = pickle.loads(decompress_namespace(serialized_data))
         
         # Re-import modules that were stored as module names
         modules_to_import = {}
@@ -98,12 +306,13 @@ async def deserialize_namespace(serialized_data: str) -> Dict[str, Any]:
                 original_key = key[10:]  # Remove '__module__' prefix
                 module_name = value
                 try:
-                    # Re-import the module
-                    imported_module = __import__(module_name)
+                    # Re-import the module (state saved before modules were
+                    # pickled by reference stores just the name)
+                    imported_module = importlib.import_module(module_name)
                     modules_to_import[original_key] = imported_module
                     keys_to_remove.append(key)
                 except ImportError:
-                    logger.warning(f"Failed to re-import module {module_name}")
+                    logger.warning("Failed to re-import module %s", module_name)
                     keys_to_remove.append(key)
         
         # Remove module name entries and add the actual modules
@@ -113,85 +322,315 @@ async def deserialize_namespace(serialized_data: str) -> Dict[str, Any]:
         
         return namespace
     except Exception as e:
-        logger.warning(f"Failed to deserialize namespace: {e}")
+        logger.warning("Failed to deserialize namespace: %s", e)
         return {}
 
-async def get_session_namespace(session_id: str) -> Dict[str, Any]:
-    """Get the execution namespace for a session from the session manager"""
+async def serialize_namespace(namespace: Dict[str, Any], dropped: Optional[List[str]] = None) -> bytes:
+    """Run serialize_namespace_sync in a worker thread
+
+    Pickling and compressing a large namespace is CPU-bound, so it is kept off
+    the event loop to let other requests proceed meanwhile.
+    """
+    return await asyncio.to_thread(serialize_namespace_sync, namespace, dropped)
+
+async def deserialize_namespace(serialized_data: bytes) -> Dict[str, Any]:
+    """Run deserialize_namespace_sync in a worker thread"""
+    if not serialized_data:
+        return {}
+    return await asyncio.to_thread(deserialize_namespace_sync, serialized_data)
+
+# Nodes that can be evaluated without running user code. Everything else, even
+# a subscript, attribute or operator, may call a dunder or property that
+# changes state, and is left to the save's byte comparison to skip
+_PURE_NODES = (ast.Expression, ast.Name, ast.Constant, ast.Tuple, ast.List, ast.expr_context)
+
+def is_pure_expression(tree: ast.Expression) -> bool:
+    """Check whether an expression can be evaluated without changing the namespace
+
+    Only names, constants, and tuples or lists of them qualify; inspecting a
+    variable is the common case this is meant to catch.
+    """
+    return all(isinstance(node, _PURE_NODES) for node in ast.walk(tree))
+
+def compile_code(code: str) -> Tuple[str, CodeType, bool]:
+    """Compile code as an expression if possible, otherwise as statements
+
+    Returns the mode ("eval" or "exec"), the code object, and whether it is a
+    pure expression. Results are cached; a SyntaxError propagates to the caller.
+    """
+    key = hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest()
+    with _code_cache_lock:
+        cached = _code_cache.get(key)
+        if cached is not None:
+            _code_cache.move_to_end(key)
+            return cached
+    
+    # Parse once as statements; a lone expression statement is then compiled
+    # in eval mode so its value can be displayed
+    module = ast.parse(code, "<string>", "exec")
+    if len(module.body) == 1 and isinstance(module.body[0], ast.Expr):
+        tree = ast.Expression(module.body[0].value)
+        compiled = ("eval", compile(tree, "<string>", "eval"), is_pure_expression(tree))
+    else:
+        compiled = ("exec", compile(module, "<string>", "exec"), False)
+    
+    with _code_cache_lock:
+        _code_cache[key] = compiled
+        if len(_code_cache) > CODE_CACHE_SIZE:
+            _code_cache.popitem(last=False)
+    return compiled
+
+async def load_session(session_id: str) -> Tuple[bool, Dict[str, Any], bytes]:
+    """Check the session is configured for Python and load its namespace in one request
+
+    Also returns the stored bytes, so a save can tell whether anything changed.
+    """
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{SESSION_MANAGER_URL}/sessions/{session_id}/environment")
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("environment") and data["environment"].get("serialized_data"):
-                    return await deserialize_namespace(data["environment"]["serialized_data"])
-            return {}
+        # Raw pickle body, with the session language carried in a header
+        response = await CLIENT.get(f"/sessions/{session_id}/environment.bin")
+        if response.status_code != 200:
+            return False, {}, b""
+        if response.headers.get("X-Session-Language") != "python":
+            return False, {}, b""
+        return True, await deserialize_namespace(response.content), response.content
     except Exception as e:
-        logger.warning(f"Failed to get session environment: {e}")
-        return {}
+        logger.warning("Failed to load session: %s", e)
+        return False, {}, b""
 
-async def save_session_namespace(session_id: str, namespace: Dict[str, Any]):
-    """Save the execution namespace for a session to the session manager"""
-    logger.error(f"ENTERING save_session_namespace with namespace keys: {list(namespace.keys())}")
+async def get_session_namespace(session_id: str) -> Dict[str, Any]:
+    """Get the execution namespace for a session from the session manager"""
+    _, namespace, _ = await load_session(session_id)
+    return namespace
+
+async def save_session_namespace(
+    session_id: str,
+    namespace: Dict[str, Any],
+    touch_activity: bool = False,
+    stored_data: Optional[bytes] = None,
+) -> List[str]:
+    """Save the execution namespace for a session to the session manager
+
+    With touch_activity the same request also records the execution, replacing
+    a separate notify_session_manager call. If the namespace serializes to
+    stored_data (the bytes it was loaded from), the upload is skipped. Returns
+    the names of variables left out of the saved state for exceeding the size
+    limits.
+    """
+    dropped: List[str] = []
     try:
-        serialized_data = await serialize_namespace(namespace)
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            await client.put(
-                f"{SESSION_MANAGER_URL}/sessions/{session_id}/environment",
-                json={
-                    "language": "python",
-                    "serialized_data": serialized_data
-                }
-            )
+        serialized_data = await serialize_namespace(namespace, dropped)
+        if serialized_data == stored_data:
+            if touch_activity:
+                notify_session_manager_in_background(session_id)
+            return dropped
+        await CLIENT.put(
+            f"/sessions/{session_id}/environment.bin",
+            params={"language": "python", "touch_activity": touch_activity},
+            content=serialized_data,
+            headers={"Content-Type": "application/octet-stream"}
+        )
     except Exception as e:
-        logger.warning(f"Failed to save session environment: {e}")
+        logger.warning("Failed to save session environment: %s", e)
+    return dropped
 
 async def verify_session_language(session_id: str) -> bool:
     """Verify that the session is configured for Python"""
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{SESSION_MANAGER_URL}/sessions/{session_id}")
-            if response.status_code == 200:
-                session_data = response.json()
-                return session_data.get("language") == "python"
-            return False
-    except Exception as e:
-        logger.warning(f"Failed to verify session language: {e}")
-        return False
+    is_python, _, _ = await load_session(session_id)
+    return is_python
 
 async def notify_session_manager(session_id: str):
     """Notify the centralized session manager of activity"""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            await client.put(f"{SESSION_MANAGER_URL}/sessions/{session_id}/activity", params={"language": "python"})
+        await CLIENT.put(f"/sessions/{session_id}/activity", params={"language": "python"}, timeout=5.0)
     except Exception as e:
-        logger.warning(f"Failed to notify session manager: {e}")
+        logger.warning("Failed to notify session manager: %s", e)
+
+def notify_session_manager_in_background(session_id: str):
+    """Send the activity ping without making the caller wait for it"""
+    task = asyncio.create_task(notify_session_manager(session_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
 # CORS configuration - allow all origins in development
 environment = os.getenv("ENVIRONMENT", "development")
 cors_origins_env = os.getenv("CORS_ORIGINS", "http://localhost:8080")
 cors_origins = ["*"] if environment == "development" else cors_origins_env.split(",")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=cors_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-class CodeRequest(BaseModel):
-    code: str
+class StaticCORSMiddleware:
+    """Minimal ASGI CORS middleware with headers precomputed at startup.
+
+    Non-preflight requests only get header appends; preflights are answered
+    directly without reaching the app.
+    """
+
+    def __init__(self, app, allow_origins: List[str]):
+        self.app = app
+        self.allow_all = "*" in allow_origins
+        self.allow_origins = frozenset(origin.encode() for origin in allow_origins)
+        # Credentials are allowed, and browsers reject a wildcard origin on
+        # credentialed requests, so an allowed Origin is always echoed back
+        # (even when every origin is allowed), as CORSMiddleware does
+        self.common_headers = [
+            (b"access-control-allow-credentials", b"true"),
+            (b"vary", b"Origin"),
+        ]
+        self.preflight_headers = self.common_headers + [
+            (b"access-control-allow-methods", b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"),
+            (b"access-control-max-age", b"600"),
+            (b"content-length", b"0"),
+        ]
+
+    def _headers_for(self, base: List[Tuple[bytes, bytes]], origin: Optional[bytes]):
+        if origin is not None and (self.allow_all or origin in self.allow_origins):
+            return base + [(b"access-control-allow-origin", origin)]
+        return base
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        origin = request_headers.get(b"origin")
+
+        if scope["method"] == "OPTIONS" and b"access-control-request-method" in request_headers:
+            headers = self._headers_for(self.preflight_headers, origin)
+            requested = request_headers.get(b"access-control-request-headers")
+            if requested:
+                headers = headers + [(b"access-control-allow-headers", requested)]
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        cors_headers = self._headers_for(self.common_headers, origin)
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + cors_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+app.add_middleware(StaticCORSMiddleware, allow_origins=cors_origins)
 
 
 class CodeResponse(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
     output: str = ""
     error: str | None = None
     error_type: str | None = None
     session_info: Dict[str, Any] | None = None
 
 
+class BatchCodeResponse(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+    
+    results: List[CodeResponse]
+    session_info: Dict[str, Any] | None = None
+
+
+class TruncatingStringIO(io.StringIO):
+    """StringIO that stops storing output once a size limit is reached"""
+    def __init__(self, limit: int):
+        super().__init__()
+        self.remaining = limit
+        self.truncated = False
+    
+    def write(self, text: str) -> int:
+        if len(text) > self.remaining:
+            self.truncated = True
+            if self.remaining <= 0:
+                return len(text)
+            super().write(text[:self.remaining])
+            self.remaining = 0
+            return len(text)
+        self.remaining -= len(text)
+        return super().write(text)
+
+
+async def read_code(request: Request) -> str:
+    """Parse the one-field {"code": ...} body directly rather than through a model"""
+    try:
+        code = orjson.loads(await request.body())["code"]
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        code = None
+    if not isinstance(code, str):
+        raise HTTPException(status_code=422, detail="Request body must be a JSON object with a 'code' string")
+    return code
+
+
+async def read_codes(request: Request) -> List[str]:
+    """Parse a {"codes": [...]} batch body, a non-empty list of code strings"""
+    try:
+        codes = orjson.loads(await request.body())["codes"]
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        codes = None
+    if not isinstance(codes, list) or not codes or not all(isinstance(code, str) for code in codes):
+        raise HTTPException(status_code=422, detail="Request body must be a JSON object with a non-empty 'codes' list of strings")
+    return codes
+
+
+def run_code(session_id: str, code: str, namespace: Dict[str, Any]) -> Tuple[str, Optional[BaseException], bool]:
+    """Run code in a namespace, capturing its output
+
+    Returns the output, the exception raised (if any), and whether the
+    namespace may have changed.
+    """
+    output_buffer = TruncatingStringIO(MAX_OUTPUT_CHARS)
+    execution_error = None
+    namespace_changed = True
+
+    with output_buffer, capture_output(output_buffer, output_buffer):
+        try:
+            mode, code_obj, pure = compile_code(code)
+            
+            # Expressions are evaluated and displayed (for REPL-like behavior)
+            if mode == "eval":
+                result = eval(code_obj, namespace)
+                # Inspecting a variable leaves the namespace as it was, so it
+                # needn't be serialized and saved again
+                namespace_changed = not pure
+                # If eval succeeds and returns a value (not None), display it
+                if result is not None:
+                    print(result)
+            else:
+                exec(code_obj, namespace)
+            
+        except BaseException as e:
+            # Includes SystemExit from exit() so it is reported like any error
+            execution_error = e
+            logger.warning("Execution error in session %s: %s", session_id[:8], e)
+
+        output = output_buffer.getvalue()
+        if output_buffer.truncated:
+            output += f"\n[output truncated after {MAX_OUTPUT_CHARS} characters]\n"
+
+    return output, execution_error, namespace_changed
+
+
+def format_code_response(
+    session_id: str,
+    output: str,
+    execution_error: Optional[BaseException],
+    session_info: Optional[Dict[str, Any]] = None,
+) -> CodeResponse:
+    """Build the response for one execution using the error handler"""
+    result = ErrorHandler.format_execution_result(
+        output=output,
+        error=execution_error,
+        session_id=session_id,
+        session_info=session_info
+    )
+    
+    return CodeResponse.model_construct(
+        output=result.output,
+        error=result.error,
+        error_type=result.error_type.value if result.error_type else None,
+        session_info=result.session_info
+    )
+
+
 @app.get("/")
 def read_root() -> dict[str, str]:
     return {"message": "Python REPL API is running"}
@@ -202,20 +641,24 @@ def read_root() -> dict[str, str]:
 
 @app.post("/execute/{session_id}", response_model=CodeResponse)
 async def execute_code(
-    request: CodeRequest, 
+    request: Request, 
     session_id: str = Path(..., description="Session GUID")
 ) -> CodeResponse:
-    logger.info(f"Executing code for session {session_id[:8]}...")
+    logger.info("Executing code for session %s...", session_id[:8])
+    
+    code = await read_code(request)
     
-    # Verify session is configured for Python
-    if not await verify_session_language(session_id):
+    # Verify session is configured for Python and fetch its namespace together
+    is_python, namespace, stored_data = await load_session(session_id)
+    if not is_python:
         raise HTTPException(
             status_code=400,
             detail=f"Session {session_id} is not configured for Python"
         )
     
     # Validate input
-    if not request.code.strip():
+    code = code.strip()
+    if not code:
         error_response = ErrorHandler.handle_validation_error(
             "Code cannot be empty", session_id
         )
@@ -224,216 +667,262 @@ async def execute_code(
             detail=error_response.message
         )
 
-    output_buffer = io.StringIO()
-    execution_error = None
+    output, execution_error, namespace_changed = run_code(session_id, code, namespace)
 
-    old_stdout = sys.stdout
-    old_stderr = sys.stderr
+    # Session info will come from session manager - we don't track it locally anymore
+    session_data = None
 
-    try:
-        sys.stdout = output_buffer
-        sys.stderr = output_buffer
+    # Save the updated namespace and record the execution in one request; a
+    # failed execution leaves the stored namespace untouched
+    if execution_error is None and namespace_changed:
+        dropped = await save_session_namespace(
+            session_id, namespace, touch_activity=True, stored_data=stored_data
+        )
+        if dropped:
+            session_data = {"unsaved_variables": dropped}
+    else:
+        notify_session_manager_in_background(session_id)
+    
+    return format_code_response(session_id, output, execution_error, session_data)
 
-        try:
-            # Get session namespace from session manager
-            namespace = await get_session_namespace(session_id)
-            
-            code = request.code.strip()
-            
-            # Try to evaluate as expression first (for REPL-like behavior)
-            try:
-                result = eval(code, namespace)
-                # If eval succeeds and returns a value (not None), display it
-                if result is not None:
-                    print(result)
-            except SyntaxError:
-                # If eval fails, try exec (for statements like assignments, imports, etc.)
-                exec(code, namespace)
-            
-            # Save updated namespace back to session manager
-            await save_session_namespace(session_id, namespace)
-            
-        except Exception as e:
-            execution_error = e
-            logger.warning(f"Execution error in session {session_id[:8]}: {e}")
 
-        output = output_buffer.getvalue()
+@app.post("/execute/{session_id}/batch", response_model=BatchCodeResponse)
+async def execute_code_batch(
+    request: Request,
+    session_id: str = Path(..., description="Session GUID")
+) -> BatchCodeResponse:
+    """Run several pieces of code in order with one session load and save
+
+    The batch stops at the first code that fails, and then nothing is saved,
+    so the stored namespace is either updated by every code or left as it was.
+    """
+    codes = [code.strip() for code in await read_codes(request)]
+    logger.info("Executing batch of %d for session %s...", len(codes), session_id[:8])
+    
+    is_python, namespace, stored_data = await load_session(session_id)
+    if not is_python:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Session {session_id} is not configured for Python"
+        )
+    
+    if not all(codes):
+        error_response = ErrorHandler.handle_validation_error(
+            "Code cannot be empty", session_id
+        )
+        raise HTTPException(
+            status_code=get_http_status_for_error_type(error_response.error_type),
+            detail=error_response.message
+        )
+    
+    results: List[CodeResponse] = []
+    namespace_changed = False
+    failed = False
+    for code in codes:
+        output, execution_error, changed = run_code(session_id, code, namespace)
+        results.append(format_code_response(session_id, output, execution_error))
+        if execution_error is not None:
+            failed = True
+            break
+        namespace_changed = namespace_changed or changed
+    
+    session_data = None
+    if not failed and namespace_changed:
+        dropped = await save_session_namespace(
+            session_id, namespace, touch_activity=True, stored_data=stored_data
+        )
+        if dropped:
+            session_data = {"unsaved_variables": dropped}
+    else:
+        notify_session_manager_in_background(session_id)
+    
+    return BatchCodeResponse.model_construct(results=results, session_info=session_data)
 
-    finally:
-        sys.stdout = old_stdout
-        sys.stderr = old_stderr
-        output_buffer.close()
 
-    # Session info will come from session manager - we don't track it locally anymore
-    session_data = None
 
-    # Notify session manager of activity
-    await notify_session_manager(session_id)
-    
-    # Format result using error handler
-    result = ErrorHandler.format_execution_result(
-        output=output,
-        error=execution_error,
-        session_id=session_id,
-        session_info=session_data
-    )
-    
-    return CodeResponse(
-        output=result.output,
-        error=result.error,
-        error_type=result.error_type.value if result.error_type else None,
-        session_info=result.session_info
-    )
 
+# Pre-encoded SSE framing; only the event payload is serialized per event
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_PREFIXES = {
+    "output": b'data: {"type":"output","content":',
+    "error": b'data: {"type":"error","content":',
+}
+_EVENT_SUFFIX = b"}\n\n"
 
+# Characters of output taken per read of StreamingOutput. Joining each event's
+# writes and encoding them with one orjson call is much faster than encoding
+# every write separately, so output is batched, but the cap keeps a flood of
+# prints flowing out in bounded events rather than one huge one
+STREAM_READ_MAX_CHARS = 64 << 10
 
+def _sse_event(payload: Dict[str, Any]) -> bytes:
+    return _SSE_PREFIX + orjson.dumps(payload) + _SSE_SUFFIX
 
-class ThreadSafeStreamingStdout:
-    """Thread-safe stdout that can stream output in real-time"""
-    def __init__(self):
-        self.buffer = []
-        self.lock = threading.Lock()
+
+class StreamingOutput:
+    """Output handed from the execution thread to the streaming response
+
+    Writes append (kind, text) items to a deque, which needs no lock, and only
+    wake the event loop when it has not already been woken since its last
+    read, so a burst of prints costs one wakeup rather than one per write.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.items: deque = deque()
+        self.ready = asyncio.Event()
+        self.wakeup_pending = False
+    
+    def put(self, kind: Optional[str], text: Optional[str]) -> None:
+        self.items.append((kind, text))
+        if not self.wakeup_pending:
+            self.wakeup_pending = True
+            self.loop.call_soon_threadsafe(self.ready.set)
+    
+    def close(self) -> None:
+        """Mark the end of the execution"""
+        self.put(None, None)
+    
+    async def read(self) -> Tuple[List[Tuple[str, str]], bool]:
+        """Wait for output and return it as (kind, text) events
+
+        Consecutive writes of the same kind are merged, up to about
+        STREAM_READ_MAX_CHARS per read. The second value is whether the end of
+        the execution was reached.
+        """
+        await self.ready.wait()
+        self.ready.clear()
+        self.wakeup_pending = False
+        
+        events: List[Tuple[str, List[str]]] = []
+        done = False
+        size = 0
+        while self.items and size < STREAM_READ_MAX_CHARS:
+            kind, text = self.items.popleft()
+            if kind is None:
+                done = True
+                break
+            size += len(text)
+            if events and events[-1][0] == kind:
+                events[-1][1].append(text)
+            else:
+                events.append((kind, [text]))
+        if not done and self.items:
+            # Output left over; let the next read return without waiting
+            self.ready.set()
+        return [(kind, ''.join(parts)) for kind, parts in events], done
+
+
+class StreamingWriter:
+    """File-like stdout/stderr replacement that feeds a StreamingOutput"""
+    def __init__(self, output: StreamingOutput, kind: str):
+        self.output = output
+        self.kind = kind
         
     def write(self, text: str) -> int:
         if text:
-            with self.lock:
-                self.buffer.append(text)
+            self.output.put(self.kind, text)
         return len(text)
     
     def flush(self):
         pass
+
+
+async def stream_python_execution(session_id: str, code: str) -> AsyncGenerator[bytes, None]:
+    """Stream Python code execution with real-time output from a worker thread"""
+    logger.info("Starting streaming execution for session %s...", session_id[:8])
     
-    def get_and_clear(self) -> str:
-        """Get all output since last call and clear buffer"""
-        with self.lock:
-            if self.buffer:
-                output = ''.join(self.buffer)
-                self.buffer.clear()
-                return output
-            return ""
-
-
-async def stream_python_execution(session_id: str, code: str) -> AsyncGenerator[str, None]:
-    """Stream Python code execution with real-time output using threading"""
-    logger.info(f"Starting streaming execution for session {session_id[:8]}...")
-    
-    # Verify session is configured for Python
-    if not await verify_session_language(session_id):
-        yield f"data: {json.dumps({'type': 'error', 'content': f'Session {session_id} is not configured for Python'})}\n\n"
+    # Verify session is configured for Python and fetch its namespace together
+    is_python, namespace, stored_data = await load_session(session_id)
+    if not is_python:
+        yield _sse_event({'type': 'error', 'content': f'Session {session_id} is not configured for Python'})
         return
     
     # Validate input
     if not code.strip():
-        yield f"data: {json.dumps({'type': 'error', 'content': 'Code cannot be empty'})}\n\n"
+        yield _sse_event({'type': 'error', 'content': 'Code cannot be empty'})
         return
 
-    # Create thread-safe stdout capture
-    streaming_stdout = ThreadSafeStreamingStdout()
-    streaming_stderr = ThreadSafeStreamingStdout()
-    execution_complete = threading.Event()
+    # Output written by the execution thread, read here as it arrives
+    streaming_output = StreamingOutput(asyncio.get_running_loop())
+    streaming_stdout = StreamingWriter(streaming_output, "output")
+    streaming_stderr = StreamingWriter(streaming_output, "error")
     execution_error = None
-
-    # Get session namespace from session manager
-    namespace = await get_session_namespace(session_id)
+    activity_recorded = False
 
     def execute_python_code(namespace_dict):
         """Execute Python code in a separate thread"""
         nonlocal execution_error
         
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
-        
         try:
-            sys.stdout = streaming_stdout
-            sys.stderr = streaming_stderr
-            
-            code_stripped = code.strip()
-            
-            try:
-                # Try to evaluate as expression first (for REPL-like behavior)
-                try:
-                    result = eval(code_stripped, namespace_dict)
+            with capture_output(streaming_stdout, streaming_stderr):
+                mode, code_obj, _ = compile_code(code.strip())
+                
+                # Expressions are evaluated and displayed (for REPL-like behavior)
+                if mode == "eval":
+                    result = eval(code_obj, namespace_dict)
                     # If eval succeeds and returns a value (not None), display it
                     if result is not None:
                         print(result)
-                except SyntaxError:
-                    # If eval fails, try exec (for statements like assignments, imports, etc.)
-                    exec(code_stripped, namespace_dict)
+                else:
+                    exec(code_obj, namespace_dict)
                     
-            except Exception as e:
-                execution_error = e
-                error_msg = str(e)
-                # For tracebacks, format them nicely
-                if hasattr(e, '__traceback__'):
-                    import traceback
-                    error_msg = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
-                
-                print(error_msg, file=sys.stderr)
+        except BaseException as e:
+            # SystemExit or KeyboardInterrupt from user code (exit(), sys.exit())
+            # must not escape the worker thread, or it would stop the event loop
+            execution_error = e
+            # Write the traceback piece by piece as it is formatted; the
+            # streaming output merges the pieces into one event
+            for part in traceback.TracebackException.from_exception(e).format():
+                streaming_stderr.write(part)
+            streaming_stderr.write("\n")
                 
         finally:
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
-            execution_complete.set()
+            streaming_output.close()
 
     try:
-        # Start execution in a separate thread
-        execution_thread = threading.Thread(target=execute_python_code, args=(namespace,))
-        execution_thread.start()
-        
-        # Stream output while execution is running
-        while not execution_complete.is_set():
-            # Check for new output
-            new_output = streaming_stdout.get_and_clear()
-            if new_output:
-                yield f"data: {json.dumps({'type': 'output', 'content': new_output})}\n\n"
-            
-            new_error = streaming_stderr.get_and_clear()
-            if new_error:
-                yield f"data: {json.dumps({'type': 'error', 'content': new_error})}\n\n"
-            
-            # Small delay to allow streaming effect
-            await asyncio.sleep(0.1)
+        # Run the execution in the default thread pool
+        execution_task = asyncio.create_task(asyncio.to_thread(execute_python_code, namespace))
         
-        # Wait for thread to complete
-        execution_thread.join(timeout=30)  # 30 second timeout
+        # Stream output as soon as the thread produces it
+        done = False
+        while not done:
+            events, done = await streaming_output.read()
+            for kind, content in events:
+                yield _PREFIXES[kind] + orjson.dumps(content) + _EVENT_SUFFIX
+        await execution_task
         
-        # Get any final output
-        final_output = streaming_stdout.get_and_clear()
-        if final_output:
-            yield f"data: {json.dumps({'type': 'output', 'content': final_output})}\n\n"
-            
-        final_error = streaming_stderr.get_and_clear()
-        if final_error:
-            yield f"data: {json.dumps({'type': 'error', 'content': final_error})}\n\n"
-        
-        # Save updated namespace back to session manager
-        await save_session_namespace(session_id, namespace)
+        # Save updated namespace back to session manager, recording the execution
+        await save_session_namespace(session_id, namespace, touch_activity=True, stored_data=stored_data)
+        activity_recorded = True
         
         # Send completion event
         return_code = 0 if execution_error is None else 1
-        yield f"data: {json.dumps({'type': 'complete', 'returnCode': return_code})}\n\n"
+        yield _sse_event({'type': 'complete', 'returnCode': return_code})
 
     except Exception as e:
-        logger.error(f"Streaming execution error in session {session_id[:8]}: {e}")
-        yield f"data: {json.dumps({'type': 'error', 'content': f'Execution error: {str(e)}'})}\n\n"
-        yield f"data: {json.dumps({'type': 'complete', 'returnCode': 1})}\n\n"
+        logger.error("Streaming execution error in session %s: %s", session_id[:8], e)
+        yield _sse_event({'type': 'error', 'content': f'Execution error: {str(e)}'})
+        yield _sse_event({'type': 'complete', 'returnCode': 1})
 
-    # Notify session manager of activity
-    await notify_session_manager(session_id)
+    # Notify session manager of activity if the save above didn't already
+    if not activity_recorded:
+        notify_session_manager_in_background(session_id)
     
-    logger.info(f"Streaming execution completed for session {session_id[:8]}")
+    logger.info("Streaming execution completed for session %s", session_id[:8])
 
 
 @app.post("/execute-stream/{session_id}")
 async def execute_code_stream(
-    request: CodeRequest, 
+    request: Request, 
     session_id: str = Path(..., description="Session GUID")
 ):
     """Execute Python code with streaming output using Server-Sent Events"""
-    logger.info(f"Starting streaming execution for session {session_id[:8]}...")
+    logger.info("Starting streaming execution for session %s...", session_id[:8])
+    code = await read_code(request)
     
     return StreamingResponse(
-        stream_python_execution(session_id, request.code),
+        stream_python_execution(session_id, code),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -458,20 +947,19 @@ def health_check() -> Dict[str, Any]:
 @app.post("/reset/{session_id}")
 async def reset_namespace(session_id: str = Path(..., description="Session GUID")) -> Dict[str, str]:
     """Reset the session namespace, clearing all variables"""
-    logger.info(f"Resetting session {session_id[:8]}...")
+    logger.info("Resetting session %s...", session_id[:8])
     
     try:
         # Clear environment in session manager
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.delete(f"{SESSION_MANAGER_URL}/sessions/{session_id}/environment")
-            if response.status_code == 200:
-                return {"message": "Namespace reset successfully", "session_id": session_id}
-            elif response.status_code == 404:
-                raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
-            else:
-                raise HTTPException(status_code=500, detail="Failed to reset session environment")
+        response = await CLIENT.delete(f"/sessions/{session_id}/environment")
+        if response.status_code == 200:
+            return {"message": "Namespace reset successfully", "session_id": session_id}
+        elif response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+        else:
+            raise HTTPException(status_code=500, detail="Failed to reset session environment")
     except httpx.RequestError as e:
-        logger.error(f"Failed to communicate with session manager: {e}")
+        logger.error("Failed to communicate with session manager: %s", e)
         raise HTTPException(status_code=503, detail="Session manager unavailable")
 
 
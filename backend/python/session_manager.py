@@ -4,9 +4,9 @@ Session Management Module for Python REPL Backend
 Provides centralized session handling with metadata, cleanup, and monitoring.
 """
 
-import time
+import heapq
 import threading
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 
@@ -43,47 +43,70 @@ class SessionManager:
         """
         self._sessions: Dict[str, Dict[str, Any]] = {}
         self._metadata: Dict[str, SessionMetadata] = {}
+        # (last_accessed, session_id) entries, oldest first. Each access pushes
+        # a new entry; entries older than the session's current last_accessed
+        # are stale and skipped when popped
+        self._expiry_heap: List[Tuple[datetime, str]] = []
+        self._lock = threading.RLock()
         self._cleanup_interval = cleanup_interval
         self._session_timeout = session_timeout
         self._cleanup_thread: Optional[threading.Thread] = None
-        self._shutdown = False
+        self._shutdown_event = threading.Event()
         
         # Start cleanup thread
         self._start_cleanup_thread()
     
+    def _track_access(self, metadata: SessionMetadata) -> None:
+        """Queue a session's current last_accessed time for expiry checks"""
+        heapq.heappush(self._expiry_heap, (metadata.last_accessed, metadata.session_id))
+        # Drop stale entries once they make up most of the heap
+        if len(self._expiry_heap) > 4 * len(self._metadata) + 64:
+            self._expiry_heap = [(m.last_accessed, sid) for sid, m in self._metadata.items()]
+            heapq.heapify(self._expiry_heap)
+    
     def get_session_namespace(self, session_id: str) -> Dict[str, Any]:
         """Get or create a namespace for the given session"""
-        if session_id not in self._sessions:
-            self._sessions[session_id] = {}
-            self._metadata[session_id] = SessionMetadata(session_id=session_id)
-        
-        # Update metadata
-        self._metadata[session_id].update_access()
-        self._metadata[session_id].namespace_size = len(self._sessions[session_id])
-        
-        return self._sessions[session_id]
+        with self._lock:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = {}
+                self._metadata[session_id] = SessionMetadata(session_id=session_id)
+            
+            # Update metadata
+            metadata = self._metadata[session_id]
+            metadata.update_access()
+            metadata.namespace_size = len(self._sessions[session_id])
+            self._track_access(metadata)
+            
+            return self._sessions[session_id]
     
     def reset_session(self, session_id: str) -> bool:
         """Reset a session's namespace"""
-        if session_id in self._sessions:
-            self._sessions[session_id].clear()
-            self._metadata[session_id].update_access()
-            self._metadata[session_id].namespace_size = 0
-            return True
-        return False
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions[session_id].clear()
+                metadata = self._metadata[session_id]
+                metadata.update_access()
+                metadata.namespace_size = 0
+                self._track_access(metadata)
+                return True
+            return False
     
     def delete_session(self, session_id: str) -> bool:
         """Completely remove a session"""
-        if session_id in self._sessions:
-            del self._sessions[session_id]
-            del self._metadata[session_id]
-            return True
-        return False
+        with self._lock:
+            if session_id in self._sessions:
+                del self._sessions[session_id]
+                del self._metadata[session_id]
+                return True
+            return False
     
     def record_execution(self, session_id: str) -> None:
         """Record that code was executed in this session"""
-        if session_id in self._metadata:
-            self._metadata[session_id].increment_execution()
+        with self._lock:
+            metadata = self._metadata.get(session_id)
+            if metadata is not None:
+                metadata.increment_execution()
+                self._track_access(metadata)
     
     def get_session_info(self, session_id: str) -> Optional[SessionMetadata]:
         """Get session metadata"""
@@ -91,30 +114,38 @@ class SessionManager:
     
     def get_all_sessions(self) -> Dict[str, SessionMetadata]:
         """Get metadata for all active sessions"""
-        return self._metadata.copy()
+        with self._lock:
+            return self._metadata.copy()
     
     def get_session_count(self) -> int:
         """Get total number of active sessions"""
         return len(self._sessions)
     
     def cleanup_expired_sessions(self) -> int:
-        """Remove expired sessions and return count of removed sessions"""
-        now = datetime.now()
-        expired_sessions = []
-        
-        for session_id, metadata in self._metadata.items():
-            if now - metadata.last_accessed > timedelta(seconds=self._session_timeout):
-                expired_sessions.append(session_id)
+        """Remove expired sessions and return count of removed sessions
+
+        Only heap entries older than the timeout are visited, so a pass costs
+        O(k log n) for k expired (or stale) entries rather than a full scan.
+        """
+        cutoff = datetime.now() - timedelta(seconds=self._session_timeout)
+        removed = 0
         
-        for session_id in expired_sessions:
-            self.delete_session(session_id)
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] < cutoff:
+                last_accessed, session_id = heapq.heappop(self._expiry_heap)
+                metadata = self._metadata.get(session_id)
+                # Skip entries superseded by a later access or a deleted session
+                if metadata is None or metadata.last_accessed != last_accessed:
+                    continue
+                self.delete_session(session_id)
+                removed += 1
         
-        return len(expired_sessions)
+        return removed
     
     def _start_cleanup_thread(self) -> None:
         """Start the background cleanup thread"""
         def cleanup_worker():
-            while not self._shutdown:
+            while not self._shutdown_event.is_set():
                 try:
                     removed = self.cleanup_expired_sessions()
                     if removed > 0:
@@ -122,18 +153,15 @@ class SessionManager:
                 except Exception as e:
                     print(f"Error during session cleanup: {e}")
                 
-                # Wait for next cleanup interval
-                for _ in range(self._cleanup_interval):
-                    if self._shutdown:
-                        break
-                    time.sleep(1)
+                # Wait for next cleanup interval, waking at once on shutdown
+                self._shutdown_event.wait(self._cleanup_interval)
         
         self._cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
         self._cleanup_thread.start()
     
     def shutdown(self) -> None:
         """Shutdown the session manager"""
-        self._shutdown = True
+        self._shutdown_event.set()
         if self._cleanup_thread and self._cleanup_thread.is_alive():
             self._cleanup_thread.join(timeout=5)
 
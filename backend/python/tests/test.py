@@ -0,0 +1,134 @@
+import pytest
+import requests
+import json
+import os
+
+# Test configuration
+BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
+SESSION_MANAGER_URL = os.getenv("SESSION_MANAGER_URL", "http://localhost:8000")
+REQUEST_TIMEOUT = 10  # seconds
+
+# Shared HTTP session so connections are kept alive across tests
+SESSION = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def http_session():
+    """Create the shared HTTP session and close it at the end"""
+    global SESSION
+    SESSION = requests.Session()
+    yield SESSION
+    SESSION.close()
+
+
+@pytest.fixture
+def python_session(http_session):
+    """Create a fresh Python session for one test"""
+    response = SESSION.post(
+        f"{SESSION_MANAGER_URL}/sessions",
+        json={"name": "Python Test Session", "language": "python"},
+        timeout=REQUEST_TIMEOUT
+    )
+    if response.status_code not in (200, 201):
+        pytest.fail(f"Failed to create session: {response.status_code} - {response.text}")
+    session_id = response.json()["id"]
+
+    yield session_id
+
+    # Cleanup
+    try:
+        SESSION.delete(f"{SESSION_MANAGER_URL}/sessions/{session_id}", timeout=5)
+    except requests.exceptions.RequestException:
+        pass  # Ignore cleanup errors
+
+
+def parse_sse_events(text):
+    """Parse the JSON payloads out of a Server-Sent Events body"""
+    return [
+        json.loads(line[len("data: "):])
+        for line in text.splitlines()
+        if line.startswith("data: ")
+    ]
+
+
+class TestPythonBackend:
+    """Test suite for Python backend webserver"""
+
+    def execute(self, session_id, code):
+        response = SESSION.post(
+            f"{BASE_URL}/execute/{session_id}",
+            json={"code": code},
+            timeout=REQUEST_TIMEOUT
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    def test_health_endpoint(self):
+        """Test that the health endpoint returns correct status"""
+        response = SESSION.get(f"{BASE_URL}/health", timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 200
+
+        data = response.json()
+        assert data["status"] == "ok"
+        assert data["language"] == "python"
+
+    def test_basic_execution(self, python_session):
+        """Test basic Python code execution"""
+        data = self.execute(python_session, "print('Hello, World!')")
+        assert data["output"] == "Hello, World!\n"
+        assert data["error"] is None
+
+    def test_variable_persistence(self, python_session):
+        """Test that variables persist between executions"""
+        self.execute(python_session, "x = 42")
+
+        data = self.execute(python_session, "x")
+        assert data["output"] == "42\n"
+        assert data["error"] is None
+
+    def test_subscript_expression_changes_are_saved(self, python_session):
+        """Test that state changed by evaluating a subscript is persisted"""
+        self.execute(python_session, "from collections import defaultdict\nd = defaultdict(list)")
+        self.execute(python_session, "d['k']")
+
+        data = self.execute(python_session, "sorted(d)")
+        assert data["output"] == "['k']\n"
+
+        # A comprehension drains an iterator, which must be saved too
+        self.execute(python_session, "it = iter([1, 2, 3])")
+        data = self.execute(python_session, "[v for v in it]")
+        assert data["output"] == "[1, 2, 3]\n"
+
+        data = self.execute(python_session, "[v for v in it]")
+        assert data["output"] == "[]\n"
+
+    def test_exit_is_reported_as_error(self, python_session):
+        """Test that exit() fails the execution instead of the server"""
+        data = self.execute(python_session, "import sys; sys.exit(3)")
+        assert data["error"] is not None
+        assert "SystemExit" in data["error"]
+
+    def test_streaming_exit_keeps_service_running(self, python_session):
+        """Test that exit() in a streamed execution doesn't stop the backend"""
+        response = SESSION.post(
+            f"{BASE_URL}/execute-stream/{python_session}",
+            json={"code": "print('before'); exit()"},
+            timeout=REQUEST_TIMEOUT
+        )
+        assert response.status_code == 200
+
+        events = parse_sse_events(response.text)
+        assert {"type": "output", "content": "before\n"} in events
+        assert any(e["type"] == "error" and "SystemExit" in e["content"] for e in events)
+        assert events[-1] == {"type": "complete", "returnCode": 1}
+
+        # The service still answers afterwards
+        response = SESSION.get(f"{BASE_URL}/health", timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 200
+        data = self.execute(python_session, "print('after')")
+        assert data["output"] == "after\n"
+
+
+if __name__ == "__main__":
+    # Run specific tests
+    pytest.main([__file__, "-v"])
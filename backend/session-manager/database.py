@@ -1,8 +1,11 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Text, text
+from sqlalchemy import create_engine, event, Column, ForeignKey, Index, LargeBinary, String, DateTime, Integer, Text, text
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.types import TypeDecorator, TEXT
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session as DBSession
-import json
+from sqlalchemy.orm import relationship, sessionmaker, Session as DBSession
+import base64
+import binascii
+import orjson
 from datetime import datetime
 import os
 import time
@@ -10,6 +13,32 @@ import time
 # Database URL from environment variable
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/sessions.db")
 
+# Connections kept open for reuse across requests, plus how many more may be
+# opened under bursts
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+# Applied to every new SQLite connection: WAL lets readers run alongside the
+# single writer, and busy_timeout makes a blocked writer wait instead of
+# failing with "database is locked"
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    # History rows are removed with their session via ON DELETE CASCADE
+    "PRAGMA foreign_keys=ON",
+)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
 # Create engine (with fallback retry logic for robustness)
 def create_db_engine():
     retries = 3  # Reduced retries since SQLite is more reliable
@@ -20,13 +49,19 @@ def create_db_engine():
                 engine = create_engine(
                     DATABASE_URL,
                     echo=False,
+                    poolclass=QueuePool,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
                     # SQLite specific settings
-                    connect_args={"check_same_thread": False}
+                    connect_args={"check_same_thread": False, "timeout": 5.0}
                 )
+                event.listen(engine, "connect", set_sqlite_pragmas)
             else:
                 # For other databases (if needed)
                 engine = create_engine(
                     DATABASE_URL,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
                     pool_pre_ping=True,
                     pool_recycle=3600,
                     echo=False
@@ -57,20 +92,18 @@ Base = declarative_base()
 class JSONEncodedDict(TypeDecorator):
     """Enables JSON storage by encoding and decoding on the fly."""
     impl = TEXT
+    # Stateless, so statements using it can share SQLAlchemy's compiled cache
+    cache_ok = True
     
     def process_bind_param(self, value, dialect):
         if value is not None:
-            # Custom serialization that handles datetime objects
-            def json_serial(obj):
-                if isinstance(obj, datetime):
-                    return obj.isoformat()
-                raise TypeError(f"Type {type(obj)} not serializable")
-            return json.dumps(value, default=json_serial)
+            # orjson writes datetime objects as ISO 8601 strings itself
+            return orjson.dumps(value).decode("utf-8")
         return value
     
     def process_result_value(self, value, dialect):
         if value is not None:
-            return json.loads(value)
+            return orjson.loads(value)
         return value
 
 # Session model
@@ -83,16 +116,104 @@ class SessionModel(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     last_accessed = Column(DateTime, default=datetime.utcnow, nullable=False)
     execution_count = Column(Integer, default=0, nullable=False)
-    history = Column(JSONEncodedDict, default=list, nullable=False)
-    environment_data = Column(Text, nullable=True)  # Base64 encoded serialized environment
+    # Superseded by the session_history table; entries still stored here are
+    # moved over by init_db() and the column is left as an empty list
+    legacy_history = Column("history", JSONEncodedDict, default=list, nullable=False)
+    environment_data = Column(LargeBinary, nullable=True)  # Raw serialized environment bytes
     environment_language = Column(String(50), nullable=True)
     environment_updated = Column(DateTime, nullable=True)
+    
+    # For the admin list's ORDER BY last_accessed DESC and per-language counts
+    __table_args__ = (
+        Index("ix_sessions_last_accessed", last_accessed.desc()),
+        Index("ix_sessions_language", language),
+    )
+    
+    history_entries = relationship(
+        "HistoryEntryModel",
+        order_by="HistoryEntryModel.seq",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+# Terminal history, one row per entry so appends and edits touch a single row
+# instead of rewriting the whole history
+class HistoryEntryModel(Base):
+    __tablename__ = "session_history"
+    
+    seq = Column(Integer, primary_key=True, autoincrement=True)  # Insertion order
+    session_id = Column(String(36), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+    entry_id = Column(String(255), nullable=False)  # Client-assigned entry id
+    type = Column(String(50), nullable=False)
+    content = Column(Text, nullable=False)
+    timestamp = Column(String(64), nullable=False)
+    
+    __table_args__ = (
+        Index("ix_session_history_session_seq", "session_id", "seq"),
+    )
+
+def migrate_environment_data():
+    """Convert environment state stored as base64 text to raw bytes
+    
+    Only SQLite is handled: its columns accept either type, so the rows can be
+    rewritten in place without altering the column.
+    """
+    if not DATABASE_URL.startswith("sqlite"):
+        return
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            "SELECT id, environment_data FROM sessions WHERE typeof(environment_data) = 'text'"
+        )).all()
+        for session_id, data in rows:
+            try:
+                raw = base64.b64decode("".join(data.split()), validate=True)
+            except binascii.Error:
+                # Not base64 (such as an old placeholder), so keep the text as is
+                raw = data.encode("utf-8")
+            conn.execute(
+                text("UPDATE sessions SET environment_data = :data WHERE id = :id"),
+                {"data": raw, "id": session_id}
+            )
+    if rows:
+        print(f"Converted environment data of {len(rows)} sessions to binary")
+
+def migrate_legacy_history():
+    """Move history entries from the old JSON column into session_history"""
+    db = SessionLocal()
+    try:
+        sessions = db.query(SessionModel).filter(SessionModel.legacy_history != []).all()
+        for session in sessions:
+            for entry in session.legacy_history or []:
+                db.add(HistoryEntryModel(
+                    session_id=session.id,
+                    entry_id=entry.get("id", ""),
+                    type=entry.get("type", ""),
+                    content=entry.get("content", ""),
+                    timestamp=str(entry.get("timestamp", "")),
+                ))
+            session.legacy_history = []
+        db.commit()
+        if sessions:
+            print(f"Migrated history of {len(sessions)} sessions to session_history")
+    finally:
+        db.close()
 
 # Create tables
 def init_db():
     """Initialize the database, creating tables if they don't exist"""
     try:
         Base.metadata.create_all(bind=engine)
+        # create_all skips tables that already exist, so add indexes introduced
+        # since an existing database was created
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        migrate_environment_data()
+        migrate_legacy_history()
+        if DATABASE_URL.startswith("sqlite"):
+            # Refresh the planner's statistics so it picks up the indexes
+            with engine.begin() as conn:
+                conn.execute(text("ANALYZE"))
         print("Database tables created successfully")
     except Exception as e:
         print(f"Error creating database tables: {e}")
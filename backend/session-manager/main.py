@@ -1,20 +1,25 @@
+import asyncio
+import base64
+import binascii
 import json
 import logging
 import os
 import uuid
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Any, Dict, Iterator, List, Optional
 
 import httpx
-from fastapi import FastAPI, HTTPException, Depends
+import orjson
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy import text
-from sqlalchemy.orm import Session as DBSession
-from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy import bindparam, case, delete, func, insert, select, text, update
+from sqlalchemy.orm import Session as DBSession, defer, selectinload
 
-from database import get_db, init_db, SessionModel
+from database import get_db, init_db, HistoryEntryModel, SessionLocal, SessionModel
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -53,12 +58,19 @@ class CreateSessionRequest(BaseModel):
 class AddHistoryEntryRequest(BaseModel):
     entry: TerminalEntry
 
+class AddHistoryEntriesRequest(BaseModel):
+    entries: List[TerminalEntry]
+
 class UpdateHistoryEntryRequest(BaseModel):
     content: str
 
 class UpdateEnvironmentRequest(BaseModel):
     language: str
     serialized_data: Optional[str] = None  # Base64 encoded serialized state
+    touch_activity: bool = False  # Also record an execution, as PUT /activity does
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[str]
 
 class RenameSessionRequest(BaseModel):
     name: str
@@ -83,20 +95,115 @@ LANGUAGE_BACKENDS = {
     "haskell": os.getenv("HASKELL_BACKEND_URL", "http://backend-haskell:8000")
 }
 
+# Recently read session histories, as returned by the API, most recently used
+# last. Every endpoint that writes history drops the session's entry, so a
+# cached list is always current (this relies on a single server process)
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "256"))
+_history_cache: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+# Statements for the hot endpoints, built once at import. SQLAlchemy caches
+# their compiled SQL, so a request only binds parameters
+SELECT_SESSION = select(SessionModel).where(SessionModel.id == bindparam("session_id"))
+SESSION_EXISTS = select(SessionModel.id).where(SessionModel.id == bindparam("session_id"))
+TOUCH_SESSION = (
+    update(SessionModel)
+    .where(SessionModel.id == bindparam("session_id"))
+    .values(last_accessed=bindparam("now"))
+    .execution_options(synchronize_session=False)
+)
+RECORD_ACTIVITY = (
+    update(SessionModel)
+    .where(SessionModel.id == bindparam("session_id"), SessionModel.language == bindparam("session_language"))
+    .values(last_accessed=bindparam("now"), execution_count=SessionModel.execution_count + 1)
+    .execution_options(synchronize_session=False)
+)
+SAVE_ENVIRONMENT = (
+    update(SessionModel)
+    .where(SessionModel.id == bindparam("session_id"))
+    .values(
+        environment_data=bindparam("data"),
+        environment_language=bindparam("data_language"),
+        environment_updated=bindparam("now"),
+        last_accessed=bindparam("now"),
+        execution_count=SessionModel.execution_count + bindparam("executions")
+    )
+    .execution_options(synchronize_session=False)
+)
+COUNT_HISTORY = select(func.count(HistoryEntryModel.seq)).where(HistoryEntryModel.session_id == bindparam("session_id"))
+
+# Read endpoints note access times here instead of writing them, so a read
+# is never a write transaction; they are written out in one UPDATE every
+# ACCESS_FLUSH_INTERVAL seconds
+ACCESS_FLUSH_INTERVAL = float(os.getenv("ACCESS_FLUSH_INTERVAL", "5"))
+_pending_access: Dict[str, datetime] = {}
+
+# Shared client for language backend calls, so connections are kept alive
+# between requests
+CLIENT: Optional[httpx.AsyncClient] = None
+
+def record_access(session_id: str) -> datetime:
+    """Note that a session was read; the time is saved by the next flush"""
+    now = datetime.utcnow()
+    _pending_access[session_id] = now
+    return now
+
+def flush_access_times() -> None:
+    """Write noted access times to the database in a single UPDATE"""
+    if not _pending_access:
+        return
+    pending = dict(_pending_access)
+    _pending_access.clear()
+    
+    accessed = case(pending, value=SessionModel.id)
+    db = SessionLocal()
+    try:
+        # Never move last_accessed back past a write made since the read
+        db.execute(
+            update(SessionModel)
+            .where(SessionModel.id.in_(pending))
+            .values(last_accessed=case(
+                (SessionModel.last_accessed > accessed, SessionModel.last_accessed),
+                else_=accessed
+            ))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to save session access times: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+async def flush_access_times_periodically() -> None:
+    """Flush noted access times every ACCESS_FLUSH_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(ACCESS_FLUSH_INTERVAL)
+        flush_access_times()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global CLIENT
     # Startup: Initialize database
     print("Session Manager starting up...")
     init_db()
+    CLIENT = httpx.AsyncClient(
+        timeout=httpx.Timeout(10.0),
+        limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=15.0)
+    )
+    flush_task = asyncio.create_task(flush_access_times_periodically())
     yield
     # Shutdown: Cleanup if needed
     print("Session Manager shutting down...")
+    flush_task.cancel()
+    flush_access_times()
+    await CLIENT.aclose()
 
 app = FastAPI(
     title="Session Manager API",
     description="Centralized session management for multi-language REPL",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS configuration
@@ -116,22 +223,73 @@ app.add_middleware(
 )
 
 # Helper functions
-def db_session_to_pydantic(db_session: SessionModel) -> SessionInfo:
-    """Convert database session model to Pydantic model"""
-    history = []
-    if db_session.history:
-        for entry in db_session.history:
-            history.append(TerminalEntry(**entry))
+def history_entry_to_dict(entry: HistoryEntryModel) -> Dict[str, Any]:
+    """Convert a history row to the terminal entry dict returned by the API"""
+    return {
+        "id": entry.entry_id,
+        "type": entry.type,
+        "content": entry.content,
+        "timestamp": entry.timestamp
+    }
+
+def terminal_entry_to_row(session_id: str, entry: TerminalEntry) -> Dict[str, Any]:
+    """Convert a terminal entry from a request to session_history column values"""
+    return {
+        "session_id": session_id,
+        "entry_id": entry.id,
+        "type": entry.type,
+        "content": entry.content,
+        "timestamp": entry.timestamp.isoformat() if isinstance(entry.timestamp, datetime) else entry.timestamp
+    }
+
+def load_history(db: DBSession, session_id: str) -> List[Dict[str, Any]]:
+    """Get a session's history entries as dicts, from the cache when present
+    
+    The returned list is shared with the cache and must not be modified.
+    """
+    history = _history_cache.get(session_id)
+    if history is not None:
+        _history_cache.move_to_end(session_id)
+        return history
+    
+    entries = db.query(HistoryEntryModel).filter(
+        HistoryEntryModel.session_id == session_id
+    ).order_by(HistoryEntryModel.seq).all()
+    history = [history_entry_to_dict(entry) for entry in entries]
+    
+    _history_cache[session_id] = history
+    if len(_history_cache) > HISTORY_CACHE_SIZE:
+        _history_cache.popitem(last=False)
+    return history
+
+def invalidate_history(session_id: str) -> None:
+    """Drop a session's cached history after it has been written"""
+    _history_cache.pop(session_id, None)
+
+def encode_environment_data(data: bytes) -> str:
+    """Base64 encode stored environment bytes for the JSON endpoints"""
+    return base64.b64encode(data).decode("ascii")
+
+def db_session_to_pydantic(db_session: SessionModel, history: Optional[List[Dict[str, Any]]] = None) -> SessionInfo:
+    """Convert database session model to Pydantic model
+    
+    history, if given, is used instead of loading db_session.history_entries.
+    The values come from our own database, so the models are built without
+    validation.
+    """
+    if history is None:
+        history = [history_entry_to_dict(entry) for entry in db_session.history_entries]
+    history = [TerminalEntry.model_construct(**entry) for entry in history]
     
     environment = None
     if db_session.environment_data:
-        environment = EnvironmentState(
+        environment = EnvironmentState.model_construct(
             language=db_session.environment_language,
-            serialized_data=db_session.environment_data,
+            serialized_data=encode_environment_data(db_session.environment_data),
             last_updated=db_session.environment_updated
         )
     
-    return SessionInfo(
+    return SessionInfo.model_construct(
         id=db_session.id,
         name=db_session.name,
         language=db_session.language,
@@ -155,7 +313,7 @@ async def health_check(db: DBSession = Depends(get_db)):
 @app.get("/sessions")
 async def list_sessions(db: DBSession = Depends(get_db)):
     """List all active sessions"""
-    sessions = db.query(SessionModel).all()
+    sessions = db.query(SessionModel).options(selectinload(SessionModel.history_entries)).all()
     session_list = [db_session_to_pydantic(session) for session in sessions]
     
     return {
@@ -163,70 +321,188 @@ async def list_sessions(db: DBSession = Depends(get_db)):
         "total": len(session_list)
     }
 
-@app.get("/admin/sessions")
-async def admin_list_sessions(db: DBSession = Depends(get_db)):
-    """Admin endpoint: List all sessions with detailed information for admin interface"""
-    sessions = db.query(SessionModel).all()
-    
-    admin_sessions = []
-    for session in sessions:
-        history_count = len(session.history) if session.history else 0
-        last_history_entry = None
-        
-        if session.history and len(session.history) > 0:
-            # Get the most recent history entry
-            last_entry = session.history[-1]
-            last_history_entry = {
-                "type": last_entry.get("type"),
-                "content": last_entry.get("content", "")[:100] + "..." if len(last_entry.get("content", "")) > 100 else last_entry.get("content", ""),
-                "timestamp": last_entry.get("timestamp")
-            }
-        
+# Sessions per query batch when streaming the admin list as NDJSON
+ADMIN_STREAM_BATCH_SIZE = 100
+
+def admin_sessions_query(db: DBSession, include_full_history: bool, limit: Optional[int], offset: int):
+    """Query (session, environment size) rows for the admin list, most recent first"""
+    query = db.query(
+        SessionModel,
+        func.length(SessionModel.environment_data)
+    ).options(defer(SessionModel.legacy_history))
+    if include_full_history:
+        query = query.options(selectinload(SessionModel.history_entries))
+    else:
+        query = query.options(defer(SessionModel.environment_data))
+    query = query.order_by(SessionModel.last_accessed.desc()).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def admin_history_stats(db: DBSession, session_ids: List[str]) -> Dict[str, Any]:
+    """Get (entry count, last entry) per session without loading whole histories"""
+    if not session_ids:
+        return {}
+    counts = db.query(
+        HistoryEntryModel.session_id,
+        func.count(HistoryEntryModel.seq),
+        func.max(HistoryEntryModel.seq)
+    ).filter(
+        HistoryEntryModel.session_id.in_(session_ids)
+    ).group_by(HistoryEntryModel.session_id).all()
+    last_seqs = [last_seq for _, _, last_seq in counts]
+    last_entries = {
+        entry.session_id: history_entry_to_dict(entry)
+        for entry in db.query(HistoryEntryModel).filter(HistoryEntryModel.seq.in_(last_seqs))
+    } if last_seqs else {}
+    return {
+        session_id: (count, last_entries.get(session_id))
+        for session_id, count, _ in counts
+    }
+
+def admin_session_to_dict(
+    session: SessionModel,
+    environment_size: Optional[int],
+    include_full_history: bool,
+    history_stats: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Build one session's entry in the admin list"""
+    if include_full_history:
         # Include full history for detailed inspection
+        full_history = [history_entry_to_dict(entry) for entry in session.history_entries]
+        history_count = len(full_history)
+        last_entry = full_history[-1] if full_history else None
+    else:
         full_history = []
-        if session.history:
-            full_history = session.history
-        
-        # Include environment details
-        environment_details = None
-        if session.environment_data:
-            environment_details = {
-                "language": session.environment_language,
-                "data": session.environment_data,
-                "last_updated": session.environment_updated,
-                "data_size": len(session.environment_data) if session.environment_data else 0
-            }
-        
-        admin_session = {
-            "id": session.id,
-            "name": session.name,
-            "language": session.language,
-            "created_at": session.created_at,
-            "last_accessed": session.last_accessed,
-            "execution_count": session.execution_count,
-            "history_count": history_count,
-            "last_history_entry": last_history_entry,
-            "has_environment": session.environment_data is not None,
-            "environment_language": session.environment_language,
-            "environment_updated": session.environment_updated,
-            "full_history": full_history,
-            "environment_details": environment_details
+        history_count, last_entry = history_stats.get(session.id, (0, None))
+    
+    last_history_entry = None
+    if last_entry:
+        # Get the most recent history entry
+        last_history_entry = {
+            "type": last_entry.get("type"),
+            "content": last_entry.get("content", "")[:100] + "..." if len(last_entry.get("content", "")) > 100 else last_entry.get("content", ""),
+            "timestamp": last_entry.get("timestamp")
+        }
+    
+    # Include environment details
+    environment_details = None
+    if environment_size:
+        environment_details = {
+            "language": session.environment_language,
+            "data": encode_environment_data(session.environment_data) if include_full_history else None,
+            "last_updated": session.environment_updated,
+            "data_size": environment_size
         }
-        admin_sessions.append(admin_session)
     
-    # Sort by last accessed (most recent first)
-    admin_sessions.sort(key=lambda x: x["last_accessed"], reverse=True)
+    return {
+        "id": session.id,
+        "name": session.name,
+        "language": session.language,
+        "created_at": session.created_at,
+        "last_accessed": session.last_accessed,
+        "execution_count": session.execution_count,
+        "history_count": history_count,
+        "last_history_entry": last_history_entry,
+        "has_environment": environment_size is not None,
+        "environment_language": session.environment_language,
+        "environment_updated": session.environment_updated,
+        "full_history": full_history,
+        "environment_details": environment_details
+    }
+
+def admin_summary(db: DBSession) -> Dict[str, Any]:
+    """Summary figures per language in one aggregate query"""
+    by_language = {}
+    active_sessions = 0
+    total_executions = 0
+    for language, count, executions, active in db.query(
+        SessionModel.language,
+        func.count(SessionModel.id),
+        func.coalesce(func.sum(SessionModel.execution_count), 0),
+        func.sum(case((SessionModel.execution_count > 0, 1), else_=0))
+    ).group_by(SessionModel.language):
+        by_language[language] = count
+        total_executions += executions
+        active_sessions += active
+    
+    return {
+        "total_sessions": sum(by_language.values()),
+        "by_language": by_language,
+        "active_sessions": active_sessions,
+        "total_executions": total_executions
+    }
+
+def stream_admin_sessions(include_full_history: bool, limit: Optional[int], offset: int) -> Iterator[bytes]:
+    """Yield the admin list as NDJSON: a summary line, then one line per session
+    
+    Rows are fetched in batches, so only one batch is held in memory at a
+    time. Uses its own database session since it runs after the endpoint
+    has returned.
+    """
+    db = SessionLocal()
+    try:
+        summary = admin_summary(db)
+        yield orjson.dumps({"total": summary["total_sessions"], "summary": summary}) + b"\n"
+        
+        query = admin_sessions_query(db, include_full_history, limit, offset)
+        batch = []
+        for row in query.yield_per(ADMIN_STREAM_BATCH_SIZE):
+            batch.append(row)
+            if len(batch) == ADMIN_STREAM_BATCH_SIZE:
+                yield admin_sessions_ndjson(db, batch, include_full_history)
+                batch = []
+        if batch:
+            yield admin_sessions_ndjson(db, batch, include_full_history)
+    finally:
+        db.close()
+
+def admin_sessions_ndjson(db: DBSession, rows: List[Any], include_full_history: bool) -> bytes:
+    """Encode a batch of admin list rows as NDJSON lines"""
+    history_stats = {}
+    if not include_full_history:
+        history_stats = admin_history_stats(db, [session.id for session, _ in rows])
+    return b"".join(
+        orjson.dumps(admin_session_to_dict(session, environment_size, include_full_history, history_stats)) + b"\n"
+        for session, environment_size in rows
+    )
+
+@app.get("/admin/sessions")
+async def admin_list_sessions(
+    include_full_history: bool = True,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: DBSession = Depends(get_db)
+):
+    """Admin endpoint: List all sessions with detailed information for admin interface
+    
+    Sessions are returned most recently accessed first; limit/offset page
+    through them in SQL. With include_full_history=false neither history rows
+    nor environment data are loaded; counts, the last entry of each session
+    and the environment size come from aggregate queries instead. With
+    format=ndjson the list is streamed, one JSON object per line.
+    """
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_admin_sessions(include_full_history, limit, offset),
+            media_type="application/x-ndjson"
+        )
+    
+    rows = admin_sessions_query(db, include_full_history, limit, offset).all()
+    history_stats = {}
+    if not include_full_history:
+        history_stats = admin_history_stats(db, [session.id for session, _ in rows])
+    admin_sessions = [
+        admin_session_to_dict(session, environment_size, include_full_history, history_stats)
+        for session, environment_size in rows
+    ]
+    summary = admin_summary(db)
     
     return {
         "sessions": admin_sessions,
-        "total": len(admin_sessions),
-        "summary": {
-            "total_sessions": len(admin_sessions),
-            "by_language": {lang: len([s for s in admin_sessions if s["language"] == lang]) 
-                          for lang in set(s["language"] for s in admin_sessions)},
-            "active_sessions": len([s for s in admin_sessions if s["execution_count"] > 0]),
-            "total_executions": sum(s["execution_count"] for s in admin_sessions)
-        }
+        "total": summary["total_sessions"],
+        "summary": summary
     }
 
 @app.post("/sessions", response_model=SessionInfo)
@@ -244,8 +520,7 @@ async def create_session(request: CreateSessionRequest, db: DBSession = Depends(
         language=request.language,
         created_at=datetime.utcnow(),
         last_accessed=datetime.utcnow(),
-        execution_count=0,
-        history=[]
+        execution_count=0
     )
     
     db.add(db_session)
@@ -254,28 +529,66 @@ async def create_session(request: CreateSessionRequest, db: DBSession = Depends(
     
     return db_session_to_pydantic(db_session)
 
+async def reset_backend_session(session_id: str, language: str) -> Optional[bool]:
+    """Ask the session's language backend to drop its state
+    
+    Returns whether the reset succeeded, or None if the language has no backend.
+    """
+    backend_url = LANGUAGE_BACKENDS.get(language)
+    if not backend_url:
+        return None
+    try:
+        response = await CLIENT.post(f"{backend_url}/reset/{session_id}")
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Failed to cleanup {language} backend for session {session_id}: {e}")
+        return False
+
+@app.post("/sessions/bulk-delete")
+async def bulk_delete_sessions(request: BulkDeleteRequest, db: DBSession = Depends(get_db)):
+    """Delete several sessions, resetting them on their backends concurrently"""
+    sessions = db.query(SessionModel.id, SessionModel.language).filter(
+        SessionModel.id.in_(request.ids)
+    ).all()
+    session_ids = [session_id for session_id, _ in sessions]
+    
+    cleanup_results = await asyncio.gather(
+        *(reset_backend_session(session_id, language) for session_id, language in sessions)
+    )
+    
+    # One statement and one commit for all of them; history rows go by cascade
+    if session_ids:
+        db.execute(
+            delete(SessionModel)
+            .where(SessionModel.id.in_(session_ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    for session_id in session_ids:
+        invalidate_history(session_id)
+    
+    found = set(session_ids)
+    return {
+        "message": "Sessions deleted successfully",
+        "deleted": session_ids,
+        "not_found": [session_id for session_id in request.ids if session_id not in found],
+        "cleanup_results": dict(zip(session_ids, cleanup_results))
+    }
+
 @app.delete("/sessions/{session_id}")
 async def delete_session(session_id: str, db: DBSession = Depends(get_db)):
     """Delete a session and cleanup from all language backends"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    db_session = db.execute(SELECT_SESSION, {"session_id": session_id}).scalar_one_or_none()
     if not db_session:
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Cleanup session from the session's language backend
-    cleanup_result = None
-    backend_url = LANGUAGE_BACKENDS.get(db_session.language)
-    if backend_url:
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(f"{backend_url}/reset/{session_id}")
-                cleanup_result = response.status_code == 200
-        except Exception as e:
-            print(f"Failed to cleanup {db_session.language} backend for session {session_id}: {e}")
-            cleanup_result = False
+    cleanup_result = await reset_backend_session(session_id, db_session.language)
     
     # Remove from database
     db.delete(db_session)
     db.commit()
+    invalidate_history(session_id)
     
     return {
         "message": "Session deleted successfully",
@@ -286,25 +599,26 @@ async def delete_session(session_id: str, db: DBSession = Depends(get_db)):
 @app.get("/sessions/{session_id}", response_model=SessionInfo)
 async def get_session(session_id: str, db: DBSession = Depends(get_db)):
     """Get session information"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    db_session = db.execute(SELECT_SESSION, {"session_id": session_id}).scalar_one_or_none()
     if not db_session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Update last accessed time
-    db_session.last_accessed = datetime.utcnow()
-    db.commit()
+    session_info = db_session_to_pydantic(db_session, load_history(db, session_id))
+    session_info.last_accessed = record_access(session_id)
     
-    return db_session_to_pydantic(db_session)
+    return session_info
 
 @app.put("/sessions/{session_id}/rename")
 async def rename_session(session_id: str, request: RenameSessionRequest, db: DBSession = Depends(get_db)):
     """Rename a session"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not db_session:
+    result = db.execute(
+        update(SessionModel)
+        .where(SessionModel.id == session_id)
+        .values(name=request.name, last_accessed=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Session not found")
-    
-    db_session.name = request.name
-    db_session.last_accessed = datetime.utcnow()
     db.commit()
     
     return {"message": "Session renamed successfully", "session_id": session_id, "new_name": request.name}
@@ -312,33 +626,31 @@ async def rename_session(session_id: str, request: RenameSessionRequest, db: DBS
 @app.put("/sessions/{session_id}/activity")
 async def update_session_activity(session_id: str, language: str, db: DBSession = Depends(get_db)):
     """Update session activity when code is executed"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    # Common case: one UPDATE, matched only when the session exists with this language
+    result = db.execute(RECORD_ACTIVITY, {"session_id": session_id, "session_language": language, "now": datetime.utcnow()})
+    if result.rowcount:
+        db.commit()
+        return {"message": "Session activity updated"}
     
-    if not db_session:
-        # Auto-create session if it doesn't exist (for backward compatibility)
-        session_count = db.query(SessionModel).count()
-        db_session = SessionModel(
-            id=session_id,
-            name=f"Session {session_count + 1}",
-            language=language,
-            created_at=datetime.utcnow(),
-            last_accessed=datetime.utcnow(),
-            execution_count=0,
-            history=[]
-        )
-        db.add(db_session)
-    else:
+    existing_language = db.query(SessionModel.language).filter(SessionModel.id == session_id).scalar()
+    if existing_language is not None:
         # Enforce single language per session
-        if db_session.language != language:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Session {session_id} is configured for {db_session.language}, cannot execute {language} code"
-            )
-        
-        # Update session metadata
-        db_session.last_accessed = datetime.utcnow()
-        db_session.execution_count += 1
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Session {session_id} is configured for {existing_language}, cannot execute {language} code"
+        )
     
+    # Auto-create session if it doesn't exist (for backward compatibility)
+    session_count = db.query(SessionModel).count()
+    db_session = SessionModel(
+        id=session_id,
+        name=f"Session {session_count + 1}",
+        language=language,
+        created_at=datetime.utcnow(),
+        last_accessed=datetime.utcnow(),
+        execution_count=0
+    )
+    db.add(db_session)
     db.commit()
     
     return {"message": "Session activity updated"}
@@ -346,75 +658,73 @@ async def update_session_activity(session_id: str, language: str, db: DBSession
 @app.post("/sessions/{session_id}/history")
 async def add_history_entry(session_id: str, request: AddHistoryEntryRequest, db: DBSession = Depends(get_db)):
     """Add a terminal entry to session history"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not db_session:
+    result = db.execute(TOUCH_SESSION, {"session_id": session_id, "now": datetime.utcnow()})
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Get existing history and create a NEW list (don't modify in place)
-    existing_history = db_session.history if db_session.history else []
+    entry_count = db.execute(COUNT_HISTORY, {"session_id": session_id}).scalar() + 1
     
-    # Add new entry - convert to dict with string timestamp
-    entry_dict = {
-        'id': request.entry.id,
-        'type': request.entry.type,
-        'content': request.entry.content,
-        'timestamp': request.entry.timestamp.isoformat() if isinstance(request.entry.timestamp, datetime) else request.entry.timestamp
-    }
+    # Appending is a single row insert; the rest of the history is untouched
+    db.add(HistoryEntryModel(**terminal_entry_to_row(session_id, request.entry)))
+    
+    try:
+        db.commit()
+        invalidate_history(session_id)
+        logger.info(f"Successfully saved {entry_count} history entries to database")
+    except Exception as e:
+        logger.error(f"Database commit error: {e}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to save history: {str(e)}")
     
-    # Create a completely new list (critical for SQLAlchemy change detection)
-    new_history = existing_history + [entry_dict]
+    return {"message": "History entry added", "entry_count": entry_count}
+
+@app.post("/sessions/{session_id}/history/bulk")
+async def add_history_entries(session_id: str, request: AddHistoryEntriesRequest, db: DBSession = Depends(get_db)):
+    """Add several terminal entries to session history in one transaction"""
+    result = db.execute(TOUCH_SESSION, {"session_id": session_id, "now": datetime.utcnow()})
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Session not found")
     
-    # Update session with the NEW list object
-    db_session.history = new_history
-    db_session.last_accessed = datetime.utcnow()
+    if request.entries:
+        db.execute(
+            insert(HistoryEntryModel),
+            [terminal_entry_to_row(session_id, entry) for entry in request.entries]
+        )
     
-    # Explicitly mark the history attribute as modified for SQLAlchemy
-    flag_modified(db_session, 'history')
+    entry_count = db.execute(COUNT_HISTORY, {"session_id": session_id}).scalar()
     
     try:
         db.commit()
-        logger.info(f"Successfully saved {len(new_history)} history entries to database")
+        invalidate_history(session_id)
+        logger.info(f"Successfully saved {len(request.entries)} history entries to database")
     except Exception as e:
         logger.error(f"Database commit error: {e}")
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to save history: {str(e)}")
     
-    return {"message": "History entry added", "entry_count": len(new_history)}
+    return {"message": "History entries added", "added": len(request.entries), "entry_count": entry_count}
 
 @app.put("/sessions/{session_id}/history/{entry_id}")
 async def update_history_entry(session_id: str, entry_id: str, request: UpdateHistoryEntryRequest, db: DBSession = Depends(get_db)):
     """Update content of a specific terminal entry in session history"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not db_session:
+    result = db.execute(TOUCH_SESSION, {"session_id": session_id, "now": datetime.utcnow()})
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Get existing history
-    existing_history = db_session.history if db_session.history else []
-    
-    # Find and update the specific entry
-    entry_found = False
-    new_history = []
-    for entry in existing_history:
-        if entry.get('id') == entry_id:
-            # Update the content of this entry
-            updated_entry = {**entry, 'content': request.content}
-            new_history.append(updated_entry)
-            entry_found = True
-        else:
-            new_history.append(entry)
-    
-    if not entry_found:
+    # Update the matching entry in place
+    result = db.execute(
+        update(HistoryEntryModel)
+        .where(HistoryEntryModel.session_id == session_id, HistoryEntryModel.entry_id == entry_id)
+        .values(content=request.content)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.rollback()
         raise HTTPException(status_code=404, detail="History entry not found")
     
-    # Update session with the modified history
-    db_session.history = new_history
-    db_session.last_accessed = datetime.utcnow()
-    
-    # Explicitly mark the history attribute as modified for SQLAlchemy
-    flag_modified(db_session, 'history')
-    
     try:
         db.commit()
+        invalidate_history(session_id)
         logger.info(f"Successfully updated history entry {entry_id} in session {session_id}")
     except Exception as e:
         logger.error(f"Database commit error: {e}")
@@ -426,66 +736,126 @@ async def update_history_entry(session_id: str, entry_id: str, request: UpdateHi
 @app.get("/sessions/{session_id}/history")
 async def get_session_history(session_id: str, db: DBSession = Depends(get_db)):
     """Get terminal history for a specific session"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not db_session:
+    # A cached history means the session exists, since deletes drop it
+    if session_id not in _history_cache and db.execute(SESSION_EXISTS, {"session_id": session_id}).first() is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    db_session.last_accessed = datetime.utcnow()
-    db.commit()
-    
-    history = db_session.history if db_session.history else []
+    history = load_history(db, session_id)
+    record_access(session_id)
     
     return {"history": history, "count": len(history)}
 
 @app.delete("/sessions/{session_id}/history")
 async def clear_session_history(session_id: str, db: DBSession = Depends(get_db)):
     """Clear terminal history for a specific session"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not db_session:
+    result = db.execute(TOUCH_SESSION, {"session_id": session_id, "now": datetime.utcnow()})
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Session not found")
-    
-    db_session.history = []
-    db_session.last_accessed = datetime.utcnow()
-    
-    # Explicitly mark the history attribute as modified
-    flag_modified(db_session, 'history')
-    
+    db.execute(delete(HistoryEntryModel).where(HistoryEntryModel.session_id == session_id))
     db.commit()
+    invalidate_history(session_id)
     
     return {"message": "History cleared", "session_id": session_id}
 
 @app.get("/sessions/{session_id}/environment")
 async def get_session_environment(session_id: str, db: DBSession = Depends(get_db)):
     """Get the serialized environment state for a session"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    db_session = db.execute(SELECT_SESSION, {"session_id": session_id}).scalar_one_or_none()
     if not db_session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    db_session.last_accessed = datetime.utcnow()
-    db.commit()
+    record_access(session_id)
     
     if not db_session.environment_data:
         return {"environment": None, "message": "No environment state stored"}
     
     environment = EnvironmentState(
         language=db_session.environment_language,
-        serialized_data=db_session.environment_data,
+        serialized_data=encode_environment_data(db_session.environment_data),
         last_updated=db_session.environment_updated
     )
     
     return {"environment": environment}
 
+@app.get("/sessions/{session_id}/bootstrap")
+async def get_session_bootstrap(session_id: str, db: DBSession = Depends(get_db)):
+    """Get the session language and environment state in a single call"""
+    db_session = db.execute(SELECT_SESSION, {"session_id": session_id}).scalar_one_or_none()
+    if not db_session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    record_access(session_id)
+    
+    environment = None
+    if db_session.environment_data:
+        environment = EnvironmentState(
+            language=db_session.environment_language,
+            serialized_data=encode_environment_data(db_session.environment_data),
+            last_updated=db_session.environment_updated
+        )
+    
+    return {"language": db_session.language, "environment": environment}
+
 @app.put("/sessions/{session_id}/environment")
 async def update_session_environment(session_id: str, request: UpdateEnvironmentRequest, db: DBSession = Depends(get_db)):
     """Update the serialized environment state for a session"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    try:
+        # Line breaks (as Ruby's Base64.encode64 adds) are allowed, but any
+        # other character outside the alphabet is rejected rather than dropped
+        data = (
+            base64.b64decode("".join(request.serialized_data.split()), validate=True)
+            if request.serialized_data else None
+        )
+    except binascii.Error:
+        raise HTTPException(status_code=422, detail="serialized_data must be base64 encoded")
+    
+    result = db.execute(SAVE_ENVIRONMENT, {
+        "session_id": session_id,
+        "data": data,
+        "data_language": request.language,
+        "now": datetime.utcnow(),
+        "executions": 1 if request.touch_activity else 0
+    })
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Session not found")
+    db.commit()
+    
+    return {"message": "Environment state updated", "session_id": session_id}
+
+@app.get("/sessions/{session_id}/environment.bin")
+async def get_session_environment_binary(session_id: str, db: DBSession = Depends(get_db)):
+    """Get the environment state as raw bytes, with the session language in a header"""
+    db_session = db.execute(SELECT_SESSION, {"session_id": session_id}).scalar_one_or_none()
     if not db_session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    db_session.environment_data = request.serialized_data
-    db_session.environment_language = request.language
-    db_session.environment_updated = datetime.utcnow()
-    db_session.last_accessed = datetime.utcnow()
+    record_access(session_id)
+    
+    return Response(
+        content=db_session.environment_data or b"",
+        media_type="application/octet-stream",
+        headers={"X-Session-Language": db_session.language}
+    )
+
+@app.put("/sessions/{session_id}/environment.bin")
+async def update_session_environment_binary(
+    session_id: str,
+    language: str,
+    request: Request,
+    touch_activity: bool = False,
+    db: DBSession = Depends(get_db)
+):
+    """Update the environment state from a raw request body"""
+    data = await request.body()
+    result = db.execute(SAVE_ENVIRONMENT, {
+        "session_id": session_id,
+        "data": data or None,
+        "data_language": language,
+        "now": datetime.utcnow(),
+        "executions": 1 if touch_activity else 0
+    })
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Session not found")
     db.commit()
     
     return {"message": "Environment state updated", "session_id": session_id}
@@ -493,14 +863,19 @@ async def update_session_environment(session_id: str, request: UpdateEnvironment
 @app.delete("/sessions/{session_id}/environment")
 async def clear_session_environment(session_id: str, db: DBSession = Depends(get_db)):
     """Clear the serialized environment state for a session"""
-    db_session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not db_session:
+    result = db.execute(
+        update(SessionModel)
+        .where(SessionModel.id == session_id)
+        .values(
+            environment_data=None,
+            environment_language=None,
+            environment_updated=None,
+            last_accessed=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Session not found")
-    
-    db_session.environment_data = None
-    db_session.environment_language = None
-    db_session.environment_updated = None
-    db_session.last_accessed = datetime.utcnow()
     db.commit()
     
     return {"message": "Environment state cleared", "session_id": session_id}
@@ -508,4 +883,4 @@ async def clear_session_environment(session_id: str, db: DBSession = Depends(get
 if __name__ == "__main__":
     import uvicorn
     backend_port = int(os.getenv("BACKEND_PORT", "8000"))
-    uvicorn.run(app, host="0.0.0.0", port=backend_port)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=backend_port, loop="uvloop", http="httptools")
\ No newline at end of file
@@ -0,0 +1,119 @@
+import pytest
+import requests
+import base64
+import os
+
+# Test configuration
+SESSION_MANAGER_URL = os.getenv("SESSION_MANAGER_URL", "http://localhost:8000")
+REQUEST_TIMEOUT = 10  # seconds
+
+# Shared HTTP session so connections are kept alive across tests
+SESSION = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def http_session():
+    """Create the shared HTTP session and close it at the end"""
+    global SESSION
+    SESSION = requests.Session()
+    yield SESSION
+    SESSION.close()
+
+
+@pytest.fixture
+def session_id(http_session):
+    """Create a fresh session for one test"""
+    response = SESSION.post(
+        f"{SESSION_MANAGER_URL}/sessions",
+        json={"name": "Session Manager Test", "language": "python"},
+        timeout=REQUEST_TIMEOUT
+    )
+    if response.status_code not in (200, 201):
+        pytest.fail(f"Failed to create session: {response.status_code} - {response.text}")
+    session_id = response.json()["id"]
+
+    yield session_id
+
+    # Cleanup
+    try:
+        SESSION.delete(f"{SESSION_MANAGER_URL}/sessions/{session_id}", timeout=5)
+    except requests.exceptions.RequestException:
+        pass  # Ignore cleanup errors
+
+
+class TestSessionManager:
+    """Test suite for the session manager API"""
+
+    def put_environment(self, session_id, serialized_data):
+        return SESSION.put(
+            f"{SESSION_MANAGER_URL}/sessions/{session_id}/environment",
+            json={"language": "python", "serialized_data": serialized_data},
+            timeout=REQUEST_TIMEOUT
+        )
+
+    def get_environment(self, session_id):
+        response = SESSION.get(
+            f"{SESSION_MANAGER_URL}/sessions/{session_id}/environment",
+            timeout=REQUEST_TIMEOUT
+        )
+        assert response.status_code == 200
+        return response.json()["environment"]
+
+    def test_health_endpoint(self):
+        """Test that the health endpoint reports a connected database"""
+        response = SESSION.get(f"{SESSION_MANAGER_URL}/health", timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 200
+        assert response.json()["database"] == "connected"
+
+    def test_environment_round_trip(self, session_id):
+        """Test that base64 environment data is returned unchanged"""
+        encoded = base64.b64encode(b"\x00state\xff").decode("ascii")
+        response = self.put_environment(session_id, encoded)
+        assert response.status_code == 200
+
+        environment = self.get_environment(session_id)
+        assert environment["serialized_data"] == encoded
+        assert environment["language"] == "python"
+
+    def test_environment_accepts_line_broken_base64(self, session_id):
+        """Test that base64 wrapped over several lines is accepted"""
+        data = bytes(range(256))
+        wrapped = base64.encodebytes(data).decode("ascii")
+        assert "\n" in wrapped
+        response = self.put_environment(session_id, wrapped)
+        assert response.status_code == 200
+
+        environment = self.get_environment(session_id)
+        assert base64.b64decode(environment["serialized_data"]) == data
+
+    def test_environment_rejects_non_base64(self, session_id):
+        """Test that data outside the base64 alphabet is rejected, not stored mangled"""
+        response = self.put_environment(session_id, "memory-stored")
+        assert response.status_code == 422
+
+        assert self.get_environment(session_id) is None
+
+    def test_binary_environment_round_trip(self, session_id):
+        """Test that the binary endpoints store and return raw bytes"""
+        data = b"\x00raw\xffbytes"
+        response = SESSION.put(
+            f"{SESSION_MANAGER_URL}/sessions/{session_id}/environment.bin",
+            params={"language": "python"},
+            data=data,
+            headers={"Content-Type": "application/octet-stream"},
+            timeout=REQUEST_TIMEOUT
+        )
+        assert response.status_code == 200
+
+        response = SESSION.get(
+            f"{SESSION_MANAGER_URL}/sessions/{session_id}/environment.bin",
+            timeout=REQUEST_TIMEOUT
+        )
+        assert response.status_code == 200
+        assert response.content == data
+        assert response.headers["x-session-language"] == "python"
+
+
+if __name__ == "__main__":
+    # Run specific tests
+    pytest.main([__file__, "-v"])